@@ -0,0 +1,186 @@
+import os
+import glob
+import argparse
+import numpy
+import pandas
+from stats import t_quantile, TOTAL_PREFIXES
+
+KEYS = ["library", "dataset", "function"]
+# Columns of the Runner's output; traces, phases, sweeps and the other
+# files written next to it have different ones and are skipped
+RUNNER_COLUMNS = {"Domain", "Energy (micro joules)", "Duration (s)"}
+
+
+def _layout(path):
+    """Return "runner" or "evaluation" for a result file, or None for any other CSV."""
+    try:
+        columns = set(pandas.read_csv(path, nrows=0).columns)
+    except (ValueError, OSError):
+        return None
+    if RUNNER_COLUMNS <= columns:
+        return "runner"
+    if "Time" in columns and len(columns) > 1:
+        return "evaluation"
+    return None
+
+
+def _read_file(path):
+    """Read one result file into the long format, whichever layout it uses."""
+    frame = pandas.read_csv(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if "Domain" in frame.columns:
+        # Runner output: module-function-timestamp.csv, one row per domain
+        if "Iteration" not in frame.columns:
+            frame["Iteration"] = numpy.arange(len(frame)) // max(frame["Domain"].nunique(), 1)
+        if "Batch" not in frame.columns:
+            frame["Batch"] = 1
+        long = pandas.DataFrame({
+            "iteration": frame["Iteration"],
+            "domain": frame["Domain"],
+            "energy": frame["Energy (micro joules)"],
+            "duration": frame["Duration (s)"],
+            "batch": frame["Batch"],
+        })
+        parts = stem.split("-")
+        library, function = (parts[0], parts[1]) if len(parts) > 2 else ("", stem)
+    else:
+        # evaluation_results layout: Time followed by one column per domain
+        frame = frame.rename(columns={"Time": "duration"})
+        frame["iteration"] = numpy.arange(len(frame))
+        long = frame.melt(id_vars=["iteration", "duration"],
+                          var_name="domain", value_name="energy")
+        long["batch"] = 1
+        library, function = "", stem
+    long["library"] = library
+    long["dataset"] = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    long["function"] = function
+    return long
+
+
+def load_results(paths):
+    """Load every result CSV under the given files or directories into one frame."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "*.csv"), recursive=True)))
+        else:
+            files.append(path)
+    files = [path for path in files if _layout(path)]
+    if not files:
+        return pandas.DataFrame(columns=KEYS + ["iteration", "domain", "energy",
+                                                "duration", "batch"])
+    return pandas.concat([_read_file(path) for path in files], ignore_index=True)
+
+
+def load_store(store, **filters):
+    """Load the samples of a ResultStore query into the same long format."""
+    frame = pandas.DataFrame(store.query(**filters))
+    if frame.empty:
+        return load_results([])
+    frame["library"] = frame["module"]
+    frame["dataset"] = frame["dataset"].map(
+        lambda dataset: ",".join(sorted(dataset or {})))
+    return frame[KEYS + ["iteration", "domain", "energy", "duration", "batch"]]
+
+
+def _describe(frame, keys, confidence):
+    """Per-call energy, mean power, EDP and CI for every group of keys."""
+    frame = frame.assign(
+        energy_per_call=frame["energy"] / frame["batch"],
+        duration_per_call=frame["duration"] / frame["batch"])
+    # Energy in J times time in s, per call
+    frame["edp"] = frame["energy_per_call"] / 1e6 * frame["duration_per_call"]
+    grouped = frame.groupby(keys, sort=False)
+    summary = grouped.agg(
+        samples=("energy_per_call", "size"),
+        energy=("energy_per_call", "mean"),
+        energy_std=("energy_per_call", "std"),
+        duration=("duration_per_call", "mean"),
+        edp=("edp", "mean"),
+        total_energy=("energy", "sum"),
+        total_duration=("duration", "sum"),
+    ).reset_index()
+    summary["power"] = summary["total_energy"] / 1e6 / summary["total_duration"]
+    dof = (summary["samples"] - 1).clip(lower=1)
+    quantiles = numpy.array([t_quantile(0.5 + confidence / 2, d) for d in dof.unique()])
+    t = dof.map(dict(zip(dof.unique(), quantiles)))
+    half = t * summary["energy_std"] / numpy.sqrt(summary["samples"])
+    summary["ci_low"] = summary["energy"] - half
+    summary["ci_high"] = summary["energy"] + half
+    return summary.drop(columns=["total_energy", "total_duration"])
+
+
+def summarize(frame, confidence=0.95):
+    """Summarize every domain of every function, plus a total over package and DRAM."""
+    per_domain = _describe(frame, KEYS + ["domain"], confidence)
+    included = frame[frame["domain"].str.startswith(TOTAL_PREFIXES)]
+    totals = included.groupby(KEYS + ["iteration"], sort=False).agg(
+        energy=("energy", "sum"), duration=("duration", "first"),
+        batch=("batch", "first")).reset_index()
+    total = _describe(totals, KEYS, confidence)
+    total["domain"] = "total"
+    return pandas.concat([per_domain, total], ignore_index=True)
+
+
+def rank(summary, domain="total"):
+    """Rank functions by mean energy per call for one domain."""
+    ranked = summary[summary["domain"] == domain].sort_values("energy")
+    ranked = ranked.reset_index(drop=True)
+    ranked.index += 1
+    return ranked
+
+
+def compare(summary, across="dataset", domain="total"):
+    """Table of energy per call with one column per value of across (dataset or library)."""
+    rows = [key for key in KEYS if key != across]
+    selected = summary[summary["domain"] == domain]
+    return selected.pivot_table(index=rows, columns=across, values="energy")
+
+
+def plot_comparison(table, filename, title="Energy per call (micro joules)"):
+    # Imported here so importing this module does not switch the backend
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed, skipping plot")
+        return
+    if table.index.nlevels > 1:
+        # Drop index levels that are the same for every row, e.g. an empty library
+        constant = [name for name in table.index.names
+                    if table.index.get_level_values(name).nunique() == 1]
+        if len(constant) < table.index.nlevels:
+            table = table.droplevel(constant)
+    axes = table.plot.bar(logy=True, figsize=(max(6, len(table) * 0.6), 4))
+    axes.set_title(title)
+    axes.set_ylabel("micro joules")
+    plt.tight_layout()
+    plt.savefig(filename)
+    plt.close()
+
+
+def report(paths, output, across="dataset", domain="total"):
+    frame = load_results(paths)
+    summary = summarize(frame)
+    os.makedirs(output, exist_ok=True)
+    summary.to_csv(os.path.join(output, "summary.csv"), index=False)
+    rank(summary, domain).to_csv(os.path.join(output, "ranking.csv"), index_label="rank")
+    table = compare(summary, across, domain)
+    table.to_csv(os.path.join(output, f"by_{across}.csv"))
+    plot_comparison(table, os.path.join(output, f"by_{across}.png"))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Summarize and compare SLEM result files.")
+    parser.add_argument("paths", nargs="+", help="result CSV files or directories")
+    parser.add_argument("--output", default="report", help="directory for the report")
+    parser.add_argument("--across", default="dataset", choices=["dataset", "library"],
+                        help="compare the same function across datasets or libraries")
+    parser.add_argument("--domain", default="total", help="domain used for ranking")
+    arguments = parser.parse_args()
+    summary = report(arguments.paths, arguments.output, arguments.across, arguments.domain)
+    print(rank(summary, arguments.domain)[KEYS + ["energy", "ci_low", "ci_high", "power",
+                                                  "edp", "samples"]].to_string())
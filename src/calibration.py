@@ -0,0 +1,80 @@
+import os
+import time
+import json
+import socket
+from energy_measure import EnergyTracker
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "slem", "calibration.json")
+
+
+def _empty():
+    pass
+
+
+def measure_idle(window=5.0):
+    """Return the idle power (W) of every domain over a quiet window."""
+    et = EnergyTracker()
+    et.start()
+    time.sleep(window)
+    et.stop()
+    duration = et.stop_time - et.start_time
+    power = {domain: energy / 1e6 / duration
+             for domain, energy in et.compute().items()}
+    et.close()
+    return power
+
+
+def measure_overhead(idle_power, iterations=200):
+    """Return the mean dynamic energy (uJ) and duration (s) of measuring an empty function."""
+    et = EnergyTracker()
+    totals = {}
+    duration = 0.0
+    for _ in range(iterations):
+        et.start()
+        _empty()
+        et.stop()
+        elapsed = et.stop_time - et.start_time
+        duration += elapsed
+        for domain, energy in et.compute().items():
+            idle = idle_power.get(domain, 0.0) * 1e6 * elapsed
+            totals[domain] = totals.get(domain, 0.0) + energy - idle
+    et.close()
+    overhead = {domain: total / iterations for domain, total in totals.items()}
+    return overhead, duration / iterations
+
+
+def calibrate(window=5.0, iterations=200):
+    idle_power = measure_idle(window)
+    overhead, duration = measure_overhead(idle_power, iterations)
+    return {
+        "created": time.time(),
+        "idle_power": idle_power,
+        "overhead": overhead,
+        "overhead_duration": duration,
+    }
+
+
+def get_calibration(max_age=24 * 3600, refresh=False, window=5.0, iterations=200,
+                    path=CACHE_PATH):
+    """Return this host's calibration, measuring it again once it is older than max_age seconds."""
+    host = socket.gethostname()
+    cache = {}
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        pass
+    entry = cache.get(host)
+    if entry and not refresh and time.time() - entry["created"] < max_age:
+        return entry
+
+    print(f"Calibrating idle power for {window} s, keep the machine quiet")
+    entry = calibrate(window, iterations)
+    cache[host] = entry
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        print(f"Unable to cache calibration: {e}")
+    return entry
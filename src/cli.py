@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import inspect
+import argparse
+import datetime
+from runner import Runner
+from results import DEFAULT_PATH
+from comparison import Comparison
+
+# Runner.run keyword arguments an experiment may set under "options"
+RUN_OPTIONS = [name for name in inspect.signature(Runner.run).parameters
+               if name not in ("self", "mname", "fname", "args", "frquency", "interval",
+                               "csv", "dataset")]
+
+
+def load_spec(path):
+    """Read an experiment spec from a TOML, JSON or YAML file."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        if extension == ".json":
+            return json.load(f)
+        if extension == ".toml":
+            try:
+                import tomllib
+            except ImportError:
+                try:
+                    import tomli as tomllib
+                except ImportError:
+                    raise ValueError("Reading TOML specs needs Python 3.11 or tomli")
+            return tomllib.load(f)
+        if extension in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("Reading YAML specs needs PyYAML")
+            return yaml.safe_load(f)
+    raise ValueError(f"Unknown spec format {extension!r}, use .toml, .json or .yaml")
+
+
+def _datasets(value, base):
+    """Map df_N handles to absolute paths; a plain list is numbered from df_0."""
+    if isinstance(value, list):
+        value = {f"df_{i}": path for i, path in enumerate(value)}
+    return {name: os.path.join(base, os.path.expanduser(path))
+            for name, path in (value or {}).items()}
+
+
+def _target(entry, i, base):
+    """Return the module name of an experiment entry and the directory to import it from."""
+    if "file" in entry:
+        path = os.path.join(base, os.path.expanduser(entry["file"]))
+        return os.path.splitext(os.path.basename(path))[0], os.path.dirname(os.path.abspath(path))
+    if "module" in entry:
+        return entry["module"], None
+    raise ValueError(f"Experiment {i + 1} needs a module or a file")
+
+
+def _comparison(experiment, i, base, defaults):
+    """Build an interleaved comparison job from a "compare" experiment."""
+    candidates = []
+    directories = []
+    for entry in experiment["compare"]:
+        module, directory = _target(entry, i, base)
+        if not entry.get("function"):
+            raise ValueError(f"Experiment {i + 1} needs a function for every compared entry")
+        candidate = {"module": module, "function": entry["function"]}
+        if "args" in entry:
+            candidate["args"] = {key: str(value) for key, value in entry["args"].items()}
+        candidates.append(candidate)
+        directories.append(directory)
+    datasets = dict(defaults["datasets"])
+    datasets.update(_datasets(experiment.get("datasets"), base))
+    return {
+        "compare": candidates,
+        "directories": [directory for directory in directories if directory],
+        "args": {key: str(value) for key, value in experiment.get("args", {}).items()},
+        "datasets": datasets,
+        "rounds": int(experiment.get("repetitions", defaults["repetitions"])),
+        "interval": experiment.get("interval", defaults["interval"]),
+        "options": {key: experiment[key] for key in
+                    ("order", "warmup", "min_window", "check_equal", "fresh_args", "seed")
+                    if key in experiment},
+    }
+
+
+def experiments(spec, base):
+    """Expand a spec into one job per function, with the defaults of the spec filled in."""
+    defaults = {
+        "repetitions": spec.get("repetitions", 10),
+        "interval": spec.get("interval", 0),
+        "datasets": _datasets(spec.get("datasets"), base),
+        "options": spec.get("options", {}),
+    }
+    jobs = []
+    for i, experiment in enumerate(spec.get("experiments", [])):
+        if "compare" in experiment:
+            jobs.append(_comparison(experiment, i, base, defaults))
+            continue
+        module, directory = _target(experiment, i, base)
+        functions = experiment.get("functions") or [experiment.get("function")]
+        if not all(functions):
+            raise ValueError(f"Experiment {i + 1} needs a function or functions")
+        options = {**defaults["options"], **experiment.get("options", {})}
+        unknown = set(options) - set(RUN_OPTIONS)
+        if unknown:
+            raise ValueError(f"Experiment {i + 1} has unknown options: {', '.join(sorted(unknown))}")
+        datasets = dict(defaults["datasets"])
+        datasets.update(_datasets(experiment.get("datasets"), base))
+        for function in functions:
+            jobs.append({
+                "module": module,
+                "directory": directory,
+                "function": function,
+                "args": {key: str(value) for key, value in experiment.get("args", {}).items()},
+                "repetitions": int(experiment.get("repetitions", defaults["repetitions"])),
+                "interval": experiment.get("interval", defaults["interval"]),
+                "datasets": datasets,
+                "options": options,
+            })
+    return jobs
+
+
+def run_comparison(runner, job, prefix, progress):
+    """Run one interleaved comparison and return 1 if it failed."""
+    for directory in job["directories"]:
+        if directory not in sys.path:
+            sys.path.append(directory)
+    names = " vs ".join(f"{c['module']}.{c['function']}" for c in job["compare"])
+    print(f"{progress} {names} x{job['rounds']}", flush=True)
+    try:
+        comparison = Comparison(runner, job["compare"], job["args"], job["datasets"],
+                                job["rounds"], interval=job["interval"], **job["options"])
+        print(comparison.run(prefix))
+        failed = runner.errors
+    except Exception as e:
+        print(f"Exception occurred:{e}")
+        failed = True
+    print(f"{progress} {names} {'FAILED' if failed else 'done'}", flush=True)
+    return int(bool(failed))
+
+
+def run_spec(path, output=None, store=None, verbose=False, refresh=False):
+    """Run every experiment of a spec and return the number of failed ones."""
+    spec = load_spec(path)
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = experiments(spec, base)
+    if refresh:
+        for job in jobs:
+            if "compare" not in job:
+                job["options"] = {**job["options"], "refresh": True}
+    output = output or os.path.join(base, spec.get("output", "results"))
+    os.makedirs(output, exist_ok=True)
+    store = store or os.path.join(base, spec.get("store", DEFAULT_PATH))
+    runner = Runner(store_path=store)
+    failures = 0
+    started = time.perf_counter()
+    for i, job in enumerate(jobs, 1):
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        if "compare" in job:
+            failures += run_comparison(runner, job, os.path.join(output, f"comparison-{stamp}"),
+                                       f"[{i}/{len(jobs)}]")
+            continue
+        if job["directory"] and job["directory"] not in sys.path:
+            sys.path.append(job["directory"])
+        name = f"{job['module']}.{job['function']}"
+        csv = os.path.join(output, f"{job['module']}-{job['function']}-{stamp}.csv")
+        print(f"[{i}/{len(jobs)}] {name} x{job['repetitions']}", flush=True)
+        result = runner.run(job["module"], job["function"], job["args"], job["repetitions"],
+                            job["interval"], csv, job["datasets"], **job["options"])
+        failed = runner.errors or runner.last_run_id is None
+        failures += bool(failed)
+        if verbose or failed:
+            print(result)
+        print(f"[{i}/{len(jobs)}] {name} {'FAILED' if failed else 'done'}"
+              f" (run {runner.last_run_id})", flush=True)
+    runner.store.close()
+    print(f"{len(jobs) - failures} of {len(jobs)} experiments succeeded in "
+          f"{time.perf_counter() - started:.1f} s, results in {store}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the experiments of a SLEM spec file without the GUI.")
+    parser.add_argument("spec", help="experiment spec (.toml, .json or .yaml)")
+    parser.add_argument("--output", help="directory for the CSV files (default: spec's output)")
+    parser.add_argument("--store", help="SQLite results database (default: spec's store)")
+    parser.add_argument("--verbose", action="store_true", help="print the Runner output of every run")
+    parser.add_argument("--refresh", action="store_true",
+                        help="measure again even where memo would reuse stored results")
+    arguments = parser.parse_args(argv)
+    try:
+        failures = run_spec(arguments.spec, arguments.output, arguments.store,
+                            arguments.verbose, arguments.refresh)
+    except (OSError, ValueError) as e:
+        print(f"Invalid spec {arguments.spec}: {e}", file=sys.stderr)
+        return 2
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
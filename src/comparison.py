@@ -0,0 +1,211 @@
+import csv
+import random
+import inspect
+import datetime
+import numpy
+from energy_measure import EnergyTracker
+from stats import confidence_interval, sign_flip_test, TOTAL_PREFIXES
+
+ORDERS = ("ABBA", "ABAB", "random")
+
+
+def outputs_equal(a, b):
+    """Compare two results, including DataFrames, Series and arrays."""
+    if hasattr(a, "equals") and type(a) is type(b):
+        return bool(a.equals(b))
+    if isinstance(a, numpy.ndarray) or isinstance(b, numpy.ndarray):
+        return bool(numpy.array_equal(a, b))
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
+
+
+def schedule(count, rounds, order="ABBA", seed=0):
+    """Yield the order of the candidates in every round.
+
+    ABBA reverses every other round so drift hits every candidate
+    equally, ABAB keeps one order and random shuffles every round.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Unknown order {order!r}, use one of {', '.join(ORDERS)}")
+    base = list(range(count))
+    generator = random.Random(seed)
+    for i in range(rounds):
+        if order == "ABBA":
+            yield base if i % 2 == 0 else base[::-1]
+        elif order == "ABAB":
+            yield base
+        else:
+            shuffled = base[:]
+            generator.shuffle(shuffled)
+            yield shuffled
+
+
+class Comparison:
+    """Measures alternative implementations interleaved, with matched inputs.
+
+    candidates is a list of {"module", "function", optional "args"}
+    entries; args are shared unless a candidate overrides them. Every
+    round measures each candidate once in the order given by schedule(),
+    and the energy (package and DRAM) and time per call of every
+    candidate are paired with the first candidate's in the same round.
+    """
+
+    def __init__(self, runner, candidates, args=None, dataset=None, rounds=10, order="ABBA",
+                 interval=0, warmup=1, min_window=0, check_equal=False, fresh_args=False,
+                 seed=0):
+        if len(candidates) < 2:
+            raise ValueError("A comparison needs at least two functions")
+        self.runner = runner
+        self.candidates = candidates
+        self.args = args or {}
+        self.dataset = dataset or {}
+        self.rounds = rounds
+        self.order = order
+        self.interval = interval
+        self.warmup = warmup
+        self.min_window = min_window
+        self.check_equal = check_equal
+        self.fresh_args = fresh_args
+        self.seed = seed
+        self.results = []
+
+    def name(self, candidate):
+        return f"{candidate['module'].strip()}.{candidate['function'].strip()}"
+
+    def prepare(self, namespace):
+        """Bind every candidate to its arguments; returns (call, make_call) pairs."""
+        prepared = []
+        for candidate in self.candidates:
+            args = candidate.get("args", self.args)
+            function = self.runner.resolve(candidate["module"], candidate["function"])
+            evaluated_args = self.runner.evaluate(args, namespace)
+            call = self.runner.bind(function, evaluated_args)
+            make_call = None
+            if self.fresh_args:
+                make_call = self.runner.factory(function, args, evaluated_args,
+                                                self.fresh_args, namespace)
+            if inspect.iscoroutinefunction(function):
+                # Measure the awaited call, as Runner.run does, not the coroutine creation
+                call = self.runner.asynchronous(call)
+                if make_call is not None:
+                    def make_call(factory=make_call):
+                        return self.runner.asynchronous(factory())
+            prepared.append((call, make_call))
+        return prepared
+
+    def check_outputs(self, prepared):
+        """Return the names of the candidates whose output differs from the first one's."""
+        outputs = [(make_call() if make_call else call)() for call, make_call in prepared]
+        return [self.name(candidate) for candidate, output in
+                zip(self.candidates[1:], outputs[1:]) if not outputs_equal(outputs[0], output)]
+
+    def run(self, csv_prefix=None):
+        """Measure every round and return the report as text."""
+        runner = self.runner
+        runner.errors = 0
+        runner.profiler = None
+        runner.cooldown = None
+        csv_prefix = csv_prefix or f"comparison-{datetime.datetime.now():%Y%m%d-%H%M%S}"
+        namespace = runner.prepare(self.dataset)
+        prepared = self.prepare(namespace)
+        lines = []
+        if self.check_equal:
+            different = self.check_outputs(prepared)
+            if different:
+                runner.errors += 1
+                return f"Outputs differ from {self.name(self.candidates[0])}: " + \
+                    ", ".join(different)
+            lines.append("Outputs are equal")
+
+        trackers = []
+        run_ids = []
+        options = {"comparison": csv_prefix, "order": self.order, "rounds": self.rounds,
+                   "candidates": [self.name(candidate) for candidate in self.candidates]}
+        energy = numpy.full((self.rounds, len(self.candidates)), numpy.nan)
+        duration = numpy.full((self.rounds, len(self.candidates)), numpy.nan)
+        try:
+            for candidate, (call, make_call) in zip(self.candidates, prepared):
+                for _ in range(self.warmup):
+                    (make_call() if make_call else call)()
+                et = EnergyTracker()
+                trackers.append(et)
+                if self.min_window:
+                    et.batch = runner.batch_size(call, self.min_window, make_call)
+                run_ids.append(runner.store.start_run(
+                    candidate["module"], candidate["function"],
+                    candidate.get("args", self.args), self.dataset, options))
+
+            for i, order in enumerate(schedule(len(self.candidates), self.rounds, self.order,
+                                               self.seed)):
+                for j in order:
+                    call, make_call = prepared[j]
+                    per_call, seconds = runner.measure(trackers[j], call, self.interval,
+                                                       csv_prefix + ".csv", run_ids[j],
+                                                       make_call)
+                    if per_call is not None:
+                        energy[i, j] = sum(value for domain, value in per_call.items()
+                                           if domain.startswith(TOTAL_PREFIXES))
+                        duration[i, j] = seconds
+        finally:
+            # A failing candidate must not leave the others' trackers open or runs unfinished
+            for et in trackers:
+                et.close()
+            for run_id in run_ids:
+                runner.store.finish_run(run_id)
+
+        self.save_rounds(csv_prefix + "-rounds.csv", energy, duration)
+        self.results = self.summarize(energy, duration)
+        self.save_summary(csv_prefix + "-summary.csv")
+        for row in self.results:
+            line = (f"{row['function']}: {row['energy']:.4g} micro joules, "
+                    f"{row['duration']:.4g} s per call")
+            if "energy_difference" in row:
+                line += (f"; vs baseline {row['energy_difference']:+.4g} micro joules "
+                         f"({row['energy_change']:+.1%}, 95% CI {row['energy_ci_low']:+.4g}"
+                         f" to {row['energy_ci_high']:+.4g}, p={row['energy_p']:.3g}), "
+                         f"{row['duration_difference']:+.4g} s (p={row['duration_p']:.3g})")
+            lines.append(line)
+        lines.append(f"Wrote {csv_prefix}-rounds.csv and {csv_prefix}-summary.csv")
+        return "\n".join(lines)
+
+    def summarize(self, energy, duration):
+        """Mean per candidate and paired differences against the first candidate."""
+        results = []
+        for j, candidate in enumerate(self.candidates):
+            row = {"function": self.name(candidate),
+                   "energy": float(numpy.nanmean(energy[:, j])),
+                   "duration": float(numpy.nanmean(duration[:, j]))}
+            if j:
+                for metric, values in (("energy", energy), ("duration", duration)):
+                    paired = values[:, j] - values[:, 0]
+                    paired = paired[~numpy.isnan(paired)]
+                    mean, low, high = confidence_interval(paired)
+                    baseline = float(numpy.nanmean(values[:, 0]))
+                    row[f"{metric}_difference"] = mean
+                    row[f"{metric}_ci_low"] = low
+                    row[f"{metric}_ci_high"] = high
+                    row[f"{metric}_change"] = mean / baseline if baseline else numpy.nan
+                    row[f"{metric}_p"] = sign_flip_test(paired, seed=self.seed)
+            results.append(row)
+        return results
+
+    def save_rounds(self, filename, energy, duration):
+        with open(filename, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Round", "Function", "Energy per call (micro joules)",
+                             "Duration per call (s)"])
+            for i in range(self.rounds):
+                for j, candidate in enumerate(self.candidates):
+                    writer.writerow([i, self.name(candidate), energy[i, j], duration[i, j]])
+
+    def save_summary(self, filename):
+        columns = ["function", "energy", "duration"]
+        for metric in ("energy", "duration"):
+            columns += [f"{metric}_difference", f"{metric}_ci_low", f"{metric}_ci_high",
+                        f"{metric}_change", f"{metric}_p"]
+        with open(filename, "w") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.results)
@@ -0,0 +1,88 @@
+import os
+import time
+import hashlib
+import importlib.util
+from collections import OrderedDict
+
+# pandas and pyarrow are imported on the first load, not at start-up
+PARQUET = importlib.util.find_spec("pyarrow") is not None
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "slem", "datasets")
+
+
+class DatasetManager:
+    """Loads each dataset once and keeps it in memory with LRU eviction.
+
+    Parsed CSV files are also written to a Parquet cache keyed by path,
+    modification time and size, so a later session can skip parsing as
+    long as the file has not changed. The Parquet cache needs pyarrow and
+    is skipped when it is not installed.
+    """
+
+    def __init__(self, memory_limit=2 * 1024 ** 3, cache_dir=CACHE_DIR):
+        self.memory_limit = memory_limit
+        self.cache_dir = cache_dir
+        self.frames = OrderedDict()
+        self.memory = 0
+        self.hashes = {}
+
+    def key(self, path):
+        stat = os.stat(path)
+        identity = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def content_hash(self, path):
+        """Return the SHA-256 of the file's content, re-hashing only when it changed."""
+        key = self.key(path)
+        if key not in self.hashes:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self.hashes[key] = digest.hexdigest()
+        return self.hashes[key]
+
+    def load(self, path):
+        """Return the dataframe, the seconds spent loading it and where it came from."""
+        key = self.key(path)
+        if key in self.frames:
+            self.frames.move_to_end(key)
+            return self.frames[key][0], 0.0, "memory"
+
+        import pandas
+        begin = time.perf_counter()
+        cached = os.path.join(self.cache_dir, key + ".parquet")
+        if PARQUET and os.path.exists(cached):
+            frame = pandas.read_parquet(cached)
+            source = "parquet"
+        else:
+            frame = pandas.read_csv(path)
+            source = "csv"
+            self._store(frame, cached)
+        elapsed = time.perf_counter() - begin
+
+        self._remember(key, frame)
+        return frame, elapsed, source
+
+    def _store(self, frame, cached):
+        if not PARQUET:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            frame.to_parquet(cached + ".tmp")
+            os.replace(cached + ".tmp", cached)
+        except Exception as e:
+            print(f"Unable to cache dataset: {e}")
+
+    def _remember(self, key, frame):
+        size = int(frame.memory_usage(deep=True).sum())
+        self.frames[key] = (frame, size)
+        self.memory += size
+        # Always keep the most recent frame, even if it alone exceeds the limit.
+        while self.memory > self.memory_limit and len(self.frames) > 1:
+            _, (_, evicted) = self.frames.popitem(last=False)
+            self.memory -= evicted
+
+    def clear(self):
+        self.frames.clear()
+        self.memory = 0
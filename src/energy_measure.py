@@ -1,16 +1,305 @@
 import os
 import time
+import threading
+import contextlib
 from functools import wraps
 import csv
+import numpy
 import pynvml
+from placement import attribute
+from processes import ATTRIBUTED_PREFIXES
+
+
+if hasattr(os, "preadv"):
+    def _pread_into(fd, view):
+        return os.preadv(fd, [view], 0)
+else:
+    def _pread_into(fd, view):
+        data = os.pread(fd, len(view), 0)
+        view[:len(data)] = data
+        return len(data)
+
+
+class RaplReader:
+    """Keeps the energy_uj files open and re-reads them with pread."""
+
+    def __init__(self, domains):
+        self.names = list(domains)
+        self.fds = []
+        for name in self.names:
+            self.fds.append(os.open(domains[name], os.O_RDONLY))
+        self.buffers = [bytearray(32) for _ in self.fds]
+        self.views = [memoryview(buffer) for buffer in self.buffers]
+        self.sizes = [0] * len(self.fds)
+
+    def read(self):
+        # Read every domain back to back first and parse afterwards so
+        # the snapshot is as close to simultaneous as possible.
+        sizes = self.sizes
+        views = self.views
+        for i, fd in enumerate(self.fds):
+            sizes[i] = _pread_into(fd, views[i])
+        return [int(self.buffers[i][:sizes[i]]) for i in range(len(sizes))]
+
+    def close(self):
+        for fd in self.fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = []
+
+    def __del__(self):
+        self.close()
+
+
+class PowerSampler:
+    """Polls the RAPL counters from a daemon thread into a ring buffer.
+
+    Each row of the buffer holds the time since the first reading followed
+    by the average power (W) of every domain since the previous reading.
+    Once the buffer is full the oldest rows are overwritten, while the peak
+    power and the integrated energy keep covering the whole run. Readings
+    only count between begin() and finish(), so the thread may keep
+    running across several measurements.
+    """
+
+    def __init__(self, domains, rate=100, size=65536, ranges=None):
+        self.reader = RaplReader(domains)
+        self.names = self.reader.names
+        self.rate = rate
+        self.size = size
+        self.ranges = numpy.array([(ranges or {}).get(name, 0)
+                                   for name in self.names], dtype=numpy.float64)
+        self.buffer = numpy.zeros((size, len(self.names) + 1))
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.recording = False
+        # Bumped by begin(); readings started before it are dropped
+        self.epoch = 0
+        # processes.ProcessTracker read with every reading, if attributing
+        self.processes = None
+        self.package = [i for i, name in enumerate(self.names)
+                        if name.startswith(ATTRIBUTED_PREFIXES)]
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.origin = None
+        self.last = None
+        self.last_time = None
+        self.total = numpy.zeros(len(self.names))
+        self.peak = numpy.zeros(len(self.names))
+
+    def prepare(self):
+        """Clear the previous measurement; called before the start snapshot."""
+        with self.lock:
+            self.recording = False
+            self.reset()
+
+    def begin(self, counters, now):
+        # Kept cheap, it runs inside the measured window; _add turns the
+        # counters into an array with the first reading.
+        with self.lock:
+            self.origin = now
+            self.last = counters
+            self.last_time = now
+            self.epoch += 1
+            self.recording = True
+
+    def pause(self):
+        self.recording = False
+
+    def add(self, counters, now, epoch=None, processes=None):
+        with self.lock:
+            # Readings taken after the window was paused belong past the
+            # tracker's stop snapshot, which finish() records instead, and
+            # readings started before begin() may predate the start snapshot.
+            if not self.recording or (epoch is not None and epoch != self.epoch):
+                return
+            self._add(counters, now, processes)
+
+    def finish(self, counters, now):
+        with self.lock:
+            self._add(counters, now)
+
+    def _add(self, counters, now, processes=None):
+        if self.last is None or now <= self.last_time:
+            return
+        counters = numpy.array(counters, dtype=numpy.float64)
+        delta = counters - self.last
+        wrapped = delta < 0
+        if wrapped.any():
+            delta[wrapped] += self.ranges[wrapped]
+            # Readings come at most a quarter of the wrap period apart, so a
+            # "wrap" worth more than half the range is an out-of-order reading
+            if (delta[wrapped] > self.ranges[wrapped] / 2).any():
+                return
+        power = delta / ((now - self.last_time) * 1e6)
+        row = self.buffer[self.count % self.size]
+        row[0] = now - self.origin
+        row[1:] = power
+        self.count += 1
+        self.total += delta
+        numpy.maximum(self.peak, power, out=self.peak)
+        self.last = counters
+        self.last_time = now
+        if processes is not None and self.processes is not None:
+            self.processes.sample(processes, float(delta[self.package].sum()))
+
+    def sample(self):
+        epoch = self.epoch if self.recording else None
+        if epoch is None:
+            return
+        counters = self.reader.read()
+        now = time.perf_counter()
+        tracker = self.processes
+        self.add(counters, now, epoch, tracker.snapshot() if tracker else None)
+
+    def _loop(self):
+        period = 1.0 / self.rate
+        deadline = time.perf_counter() + period
+        while not self.stop_event.wait(max(0.0, deadline - time.perf_counter())):
+            self.sample()
+            deadline += period
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def halt(self):
+        self.recording = False
+        self.stop_event.set()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def stop(self):
+        self.halt()
+        self.join()
+
+    def trace(self):
+        """Return the retained rows of the ring buffer in time order."""
+        with self.lock:
+            if self.count <= self.size:
+                return self.buffer[:self.count].copy()
+            split = self.count % self.size
+            return numpy.concatenate((self.buffer[split:], self.buffer[:split]))
+
+    def close(self):
+        self.stop()
+        self.reader.close()
+
+
+# Tracker between start() and stop(), used by the module-level phase()
+_active = None
+
+
+class PhaseNode:
+    """Energy and time of one named region, summed over its calls, with nested regions as children."""
+
+    def __init__(self, name=""):
+        self.name = name
+        self.calls = 0
+        self.duration = 0.0
+        self.energy = {}
+        self.children = {}
+
+    def child(self, name):
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = PhaseNode(name)
+        return node
+
+    def walk(self, path=()):
+        """Yield (path, node) for every region below this one, parents first."""
+        for node in self.children.values():
+            yield path + (node.name,), node
+            yield from node.walk(path + (node.name,))
+
+    def to_dict(self):
+        return {"name": self.name, "calls": self.calls, "duration": self.duration,
+                "energy": self.energy,
+                "children": [node.to_dict() for node in self.children.values()]}
+
+
+class Phase(contextlib.ContextDecorator):
+    """Context manager and decorator that records a region in a tracker's phase tree.
+
+    Without a tracker the one that is running when the region is entered
+    is used; outside a measurement the region is not recorded.
+    """
+
+    def __init__(self, name, tracker=None):
+        self.name = name
+        self.tracker = tracker
+        self.entered = []
+
+    def __enter__(self):
+        tracker = self.tracker or _active
+        if tracker is not None:
+            tracker._enter_phase(self.name)
+        self.entered.append(tracker)
+        return self
+
+    def __exit__(self, *exc):
+        tracker = self.entered.pop()
+        if tracker is not None:
+            tracker._exit_phase()
+        return False
+
+
+def phase(name):
+    """Mark a region of the code being measured, e.g. with phase("parse"): ..."""
+    return Phase(name)
 
 
 class EnergyTracker:
-    def __init__(self):
-        self.rapl_path = "/sys/class/powercap/intel-rapl"
+    def __init__(self, rapl_path="/sys/class/powercap/intel-rapl", sample_rate=0,
+                 buffer_size=65536, wrap_guard=True):
+        self.rapl_path = rapl_path
         self.domains = self._get_domains()
+        self.max_ranges = self._get_ranges()
+        self.reader = RaplReader(self.domains)
+        self.sample_rate = sample_rate
+        self.sampler = None
+        if self.domains and (sample_rate or wrap_guard):
+            # Without a trace the sampler only has to read often enough
+            # that no counter can wrap twice between two readings; its
+            # thread is started once and kept until close() so short
+            # windows do not pay for starting and joining a thread.
+            guard_rate = 1.0 / self._get_guard_interval()
+            if sample_rate:
+                self.sampler = PowerSampler(self.domains, max(sample_rate, guard_rate),
+                                            buffer_size, self.max_ranges)
+            else:
+                self.sampler = PowerSampler(self.domains, guard_rate, 2,
+                                            self.max_ranges)
         self.gpus = self._get_gpus()
         self.state = "idle"
+        self.start_snapshot = 0.0
+        self.stop_snapshot = 0.0
+        # Number of back-to-back calls between start() and stop()
+        self.batch = 1
+        # Concurrent tasks per call when measuring an async def function
+        self.concurrency = 1
+        # Idle power and harness overhead from calibration.get_calibration()
+        self.calibration = None
+        # Socket the workload is pinned to; the other sockets act as control
+        self.active_socket = None
+        # Extra columns for the next measurement, recorded outside the window
+        self.annotations = {}
+        # processes.ProcessTracker splitting package energy by CPU time share
+        self.processes = None
+        # memory.MemoryTracker recording RSS, page faults and allocations
+        self.memory = None
+        # Regions marked with phase(), summed over every measurement
+        self.phases = PhaseNode()
+        self.phase_stack = []
 
     def _get_domains(self):
         socket = 0
@@ -19,20 +308,54 @@ class EnergyTracker:
             socket_path = self.rapl_path + "/intel-rapl:" + str(socket)
             if not os.path.exists(socket_path):
                 break
-            domains[open(socket_path+"/name").read().strip()
-                    ] = socket_path + "/energy_uj"
+            domains[self._read_name(socket_path)] = socket_path + "/energy_uj"
             domain = 0
             while True:
                 domain_path = socket_path + "/intel-rapl:" + \
                     str(socket) + ":" + str(domain)
                 if not os.path.exists(domain_path):
                     break
-                domains[open(domain_path+"/name").read().strip()
+                domains[self._read_name(domain_path)
                         + "-" + str(socket)] = domain_path+"/energy_uj"
                 domain += 1
             socket += 1
         return domains
 
+    def _read_name(self, path):
+        with open(path + "/name") as f:
+            return f.read().strip()
+
+    def _read_int(self, path):
+        try:
+            with open(path) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return 0
+
+    def _get_ranges(self):
+        ranges = {}
+        for domain, path in self.domains.items():
+            ranges[domain] = self._read_int(
+                os.path.join(os.path.dirname(path), "max_energy_range_uj"))
+        return ranges
+
+    def _get_guard_interval(self):
+        """Return a polling interval (s) well below the shortest wrap period."""
+        interval = 1.0
+        for domain, path in self.domains.items():
+            directory = os.path.dirname(path)
+            limits = [self._read_int(os.path.join(directory, f"constraint_{i}_{kind}"))
+                      for i in range(3) for kind in ("power_limit_uw", "max_power_uw")]
+            if self.max_ranges[domain] and max(limits):
+                interval = min(interval, self.max_ranges[domain] / max(limits) / 4)
+        return interval
+
+    def _delta(self, domain, start, stop):
+        delta = stop - start
+        if delta < 0 and self.max_ranges.get(domain):
+            delta += self.max_ranges[domain]
+        return delta
+
     def _get_gpus(self):
         try:
             pynvml.nvmlInit()
@@ -45,27 +368,95 @@ class EnergyTracker:
             return None
 
     def _get_energy(self):
-        energy = {}
-        for domain in self.domains:
-            energy[domain] = int(open(self.domains[domain]).read().strip())
+        energy = dict(zip(self.reader.names, self.reader.read()))
         if self.gpus:
             for i in self.gpus:
                 energy[i] = pynvml.nvmlDeviceGetTotalEnergyConsumption(
                     self.gpus[i])
         return energy
 
+    def _counters(self, energy):
+        return [energy[domain] for domain in self.reader.names]
+
+    def phase(self, name):
+        """Return a context manager/decorator recording name as a nested region of this tracker."""
+        return Phase(name, self)
+
+    def _enter_phase(self, name):
+        parent = self.phase_stack[-1][0] if self.phase_stack else self.phases
+        self.phase_stack.append((parent.child(name), self._get_energy(), time.perf_counter()))
+
+    def _exit_phase(self):
+        now = time.perf_counter()
+        energy = self._get_energy()
+        node, start_energy, began = self.phase_stack.pop()
+        node.calls += 1
+        node.duration += now - began
+        for domain, value in energy.items():
+            node.energy[domain] = node.energy.get(domain, 0) + self._delta(
+                domain, start_energy[domain], value)
+
+    def save_phases(self, filename):
+        """Write one row per phase path, e.g. "load/parse", with its calls, time and energy."""
+        domains = []
+        for _, node in self.phases.walk():
+            for domain in node.energy:
+                if domain not in domains:
+                    domains.append(domain)
+        with open(filename, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Phase", "Calls", "Duration (s)"]
+                            + [f"{domain} (micro joules)" for domain in domains])
+            for path, node in self.phases.walk():
+                writer.writerow(["/".join(path), node.calls, node.duration]
+                                + [node.energy.get(domain, 0) for domain in domains])
+
     def start(self):
+        global _active
         if self.state == "idle":
+            if self.sampler:
+                self.sampler.prepare()
+                if self.sampler.thread is None:
+                    self.sampler.start()
+            if self.sampler:
+                self.sampler.processes = self.processes
+            if self.processes:
+                if self.sampler and self.sampler.thread:
+                    self.processes.harness = {self.sampler.thread.native_id}
+                self.processes.begin()
+            if self.memory:
+                self.memory.begin()
+            begin = time.perf_counter()
             self.start_energy = self._get_energy()
+            self.start_snapshot = time.perf_counter() - begin
+            if self.sampler:
+                self.sampler.begin(self._counters(self.start_energy), begin)
             self.start_time = time.time()
             self.state = "running"
+            _active = self
         else:
             print("Already running")
 
     def stop(self):
+        global _active
         if self.state == "running":
-            self.stop_energy = self._get_energy()
             self.stop_time = time.time()
+            if _active is self:
+                _active = None
+            if self.sampler:
+                self.sampler.pause()
+            begin = time.perf_counter()
+            self.stop_energy = self._get_energy()
+            self.stop_snapshot = time.perf_counter() - begin
+            if self.sampler:
+                self.sampler.finish(self._counters(self.stop_energy), begin)
+            if self.processes:
+                # While the sampler's thread, part of the harness, still runs
+                self.processes.end()
+            if self.sampler and self.sample_rate:
+                self.sampler.stop()
+            if self.memory:
+                self.memory.end()
             self.state = "idle"
         else:
             print("Not running")
@@ -74,33 +465,164 @@ class EnergyTracker:
         if self.state == "running":
             return
         energy = {}
-        for domain in self.domains:
-            energy[domain] = self.stop_energy[domain] - \
-                self.start_energy[domain]
+        if self.sampler:
+            # The sampler has corrected every wrap between its readings.
+            for domain, total in zip(self.sampler.names, self.sampler.total):
+                energy[domain] = int(total)
+        else:
+            for domain in self.domains:
+                energy[domain] = self._delta(domain, self.start_energy[domain],
+                                             self.stop_energy[domain])
         if self.gpus:
             for i in self.gpus:
                 energy[i] = self.stop_energy[i] - self.start_energy[i]
         return energy
 
-    def save_csv(self, filename):
+    def compute_trace(self):
+        """Return the power trace, peak power and integrated energy of the last run."""
+        if self.state == "running" or not self.sample_rate or not self.sampler:
+            return
+        names = self.sampler.names
+        rows = self.sampler.trace()
+        return {
+            "time": rows[:, 0],
+            "power": {domain: rows[:, i + 1] for i, domain in enumerate(names)},
+            "peak_power": dict(zip(names, self.sampler.peak.tolist())),
+            "energy": dict(zip(names, self.sampler.total.tolist())),
+            "samples": self.sampler.count,
+        }
+
+    def compute_dynamic(self):
+        """Split the last measurement into idle, harness overhead and dynamic energy."""
+        if self.state == "running" or not self.calibration:
+            return
+        duration = self.stop_time - self.start_time
+        idle_power = self.calibration["idle_power"]
+        overhead = self.calibration["overhead"]
+        split = {}
+        for domain, energy in self.compute().items():
+            idle = idle_power.get(domain, 0.0) * 1e6 * duration
+            split[domain] = (idle, overhead.get(domain, 0.0),
+                             energy - idle - overhead.get(domain, 0.0))
+        return split
+
+    def table(self):
+        """Return the CSV header and one row per domain for the last measurement."""
         energy = self.compute()
         duration = self.stop_time - self.start_time
+        trace = self.compute_trace()
+        dynamic = self.compute_dynamic()
+        header = ["Domain", "Energy (micro joules)", "Duration (s)",
+                  "Start Snapshot (s)", "Stop Snapshot (s)", "Batch",
+                  "Energy per call (micro joules)", "Duration per call (s)"]
+        if trace:
+            header += ["Peak Power (W)", "Integrated Energy (micro joules)",
+                       "Samples"]
+        if dynamic:
+            header += ["Idle (micro joules)", "Overhead (micro joules)",
+                       "Dynamic (micro joules)"]
+        attributed = None
+        if self.active_socket is not None:
+            # Only RAPL domains are per socket; GPUs are numbered separately
+            attributed = attribute({domain: energy[domain] for domain in self.domains
+                                    if domain in energy}, self.active_socket)
+            header += ["Attributed (micro joules)"]
+        shares = None
+        if self.processes and self.processes.stop:
+            attributed_processes = self.processes.attribute(
+                sum(value for domain, value in energy.items()
+                    if domain.startswith(ATTRIBUTED_PREFIXES)))
+            # Left blank when the window is too short for the CPU time counters
+            shares = attributed_processes[1] if attributed_processes else {}
+            header += ["Workload (micro joules)", "Harness (micro joules)",
+                       "Other work (micro joules)"]
+        memory = self.memory.values if self.memory else {}
+        header += list(memory)
+        header += list(self.annotations)
+        # Every concurrent task counts as a call, so per call means per request
+        calls = self.batch * self.concurrency
+        rows = []
+        for domain in energy:
+            row = [domain, energy[domain], duration,
+                   self.start_snapshot, self.stop_snapshot, calls,
+                   energy[domain] / calls, duration / calls]
+            if trace:
+                row += [trace["peak_power"].get(domain, ""),
+                        trace["energy"].get(domain, ""), trace["samples"]]
+            if dynamic:
+                row += list(dynamic[domain])
+            if attributed is not None:
+                row += [attributed.get(domain, "")]
+            if shares is not None:
+                if shares and domain.startswith(ATTRIBUTED_PREFIXES):
+                    row += [energy[domain] * shares[kind]
+                            for kind in ("workload", "harness", "other")]
+                else:
+                    row += ["", "", ""]
+            row += list(memory.values())
+            row += list(self.annotations.values())
+            rows.append(row)
+        return header, rows
+
+    def save_csv(self, filename):
+        header, rows = self.table()
+        with open(filename, "a") as f:
+            writer = csv.writer(f)
+            if f.tell() == 0:
+                writer.writerow(header)
+            writer.writerows(rows)
+        trace = self.compute_trace()
+        if trace:
+            self.save_trace(os.path.splitext(filename)[0] + "-trace.csv", trace)
+
+    def save_trace(self, filename, trace):
         with open(filename, "a") as f:
             writer = csv.writer(f)
             if f.tell() == 0:
-                writer.writerow(["Domain", "Energy (micro joules)", "Duration (s)"])
-            for domain in energy:
-                writer.writerow([domain, energy[domain], duration])
+                writer.writerow(["Start", "Time (s)"] + list(trace["power"]))
+            columns = [trace["time"]] + list(trace["power"].values())
+            for row in zip(*columns):
+                writer.writerow([self.start_time] + [float(v) for v in row])
+
+    def close(self):
+        if self.sampler:
+            self.sampler.close()
+        self.reader.close()
+
+
+def autorange(call, min_window=0.01, limit=10 ** 7):
+    """Return how many back-to-back calls of call() last at least min_window seconds.
+
+    Like timeit's autorange, batch sizes grow as 1, 2, 5, 10, 20, 50, ...
+    RAPL counters only update about once per millisecond, so shorter
+    windows mostly measure counter quantisation.
+    """
+    batch = 1
+    while True:
+        for factor in (1, 2, 5):
+            number = batch * factor
+            begin = time.perf_counter()
+            for _ in range(number):
+                call()
+            if time.perf_counter() - begin >= min_window or number >= limit:
+                return number
+        batch *= 10
 
 
 def measure_energy(func, fname):
     @wraps(func)
     def wrapper(*args, **kwargs):
         et = EnergyTracker()
-        et.start()
-        result = func(*args, **kwargs)
-        et.stop()
-        et.save_csv(f"{fname}")
+        try:
+            et.start()
+            result = func(*args, **kwargs)
+            et.stop()
+            et.save_csv(f"{fname}")
+        finally:
+            # Release the sampler thread and the counter files
+            if et.state == "running":
+                et.stop()
+            et.close()
         return result
     return wrapper
 
@@ -111,4 +633,5 @@ if __name__ == "__main__":
     time.sleep(5)
     et.stop()
     et.save_csv("test.csv")
+    et.close()
     print("Wrote measurement to test.csv")
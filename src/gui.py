@@ -2,9 +2,10 @@ import tkinter as tk
 import os
 import sys
 from tkinter import ttk, StringVar, BooleanVar, filedialog, messagebox
-from runner import Runner
+from worker import WorkerPool
 import threading
 import importlib
+import importlib.util
 
 # Determine the base path
 if getattr(sys, 'frozen', False):  # Running as a PyInstaller executable
@@ -50,34 +51,65 @@ class ScrollableFrame(tk.Frame):
 
 
 class GUI:
-    def __init__(self, functionExtractor):
+    # Optional settings shown below Frequency/Interval in every function tab
+    OPTION_FIELDS = [
+        ("sample_rate", "Sample rate (Hz):"),
+        ("warmup", "Warmup:"),
+        ("target_ci", "Target CI (%):"),
+        ("budget", "Budget (s):"),
+        ("min_window", "Min window (ms):"),
+        ("socket", "Pin to socket:"),
+        ("spread", "Spread over CPUs:"),
+        ("fractions", "Row fractions (sweep):"),
+        ("setup", "Setup code:"),
+        ("teardown", "Teardown code:"),
+        ("profile", "Profile rate (Hz):"),
+        ("concurrency", "Concurrent tasks (async):"),
+        ("trace_frames", "Tracemalloc frames:"),
+        ("max_temperature", "Cooldown below (C):"),
+        ("max_power", "Cooldown below (W):"),
+    ]
+    OPTION_CHECKS = [
+        ("calibrate", "Subtract idle baseline and overhead"),
+        ("worker", "Run in a warm, CPU-pinned worker process"),
+        ("bind_memory", "Bind memory to the pinned socket"),
+        ("fresh_args", "Rebuild arguments before every iteration"),
+        ("processes", "Attribute package energy to the process tree"),
+        ("memory", "Record peak RSS and page faults"),
+        ("cooldown", "Wait for the CPU to cool down (interval is the longest wait)"),
+        ("memo", "Reuse the stored results of unchanged experiments"),
+        ("refresh", "Measure again even if stored results can be reused"),
+    ]
+
+    def __init__(self, functionExtractor, coroutineExtractor=None):
         self.root = tk.Tk()
         self.root.title("Software Library Energy Meter")
         self.df_count = 0
         # Set up modules dictionary
         self.modules = {}
         self.dataset = {}
+        # Modules are imported lazily: by the function index when their
+        # signatures change and by the Runner when they are measured.
         try:
             with open(module_config_path) as mcnf:
-                names = mcnf.readlines()
-                for name in names:
-                    try:
-                        self.modules[name] = importlib.import_module(
-                            name.strip())
-                    except:
-                        print(f"Unable to import {name}")
+                for name in mcnf.read().split():
+                    self.modules[name] = None
         except Exception as e:
             print(f"{e}")
 
         self.functionExtractor = functionExtractor
-        self.runner = Runner()
+        self.coroutineExtractor = coroutineExtractor
+        self.coroutines = set()
+        self.runner = None
+        # Guards the runner and the worker pool, created by the first job that needs them
+        self.lazy_lock = threading.Lock()
+        self.workers = None
         self.function_args = {}
 
         # Initialize layout frames
         self.init_layout()
 
         # Initialize component variables
-        self.function_checkboxes = {}
         self.function_tabs = {}
 
         # Start main loop
@@ -204,8 +236,9 @@ class GUI:
             return
 
         try:
-            # Dynamically import the module to check if it exists and is valid
-            imported_module = importlib.import_module(new_module)
+            # Check that the module exists without importing it
+            if importlib.util.find_spec(new_module) is None:
+                raise ModuleNotFoundError(new_module)
 
             # Add spaces for padding around the module name
             # Add spaces before and after the module name
@@ -216,7 +249,7 @@ class GUI:
                 f.write(new_module + "\n")
 
             # Add to modules dictionary and update UI components
-            self.modules[new_module] = imported_module
+            self.modules[new_module] = None
             # Insert padded module name
             self.module_listbox.insert(tk.END, padded_module)
             self.update_module_dropdown()  # Update the dropdown with the new module
@@ -336,40 +369,98 @@ class GUI:
                 print(f"{module_name} could not be loaded: {e}")
 
     def init_function_list(self):
-        """Create scrollable list of function checkboxes."""
+        """Create a searchable list of functions."""
         tk.Label(self.left_frame.scrollable_frame, text="Functions:",
                  font=("Arial", 10)).pack(anchor="w")
 
-        # Frame for function checkboxes with scrollbar
+        # Search box, filtering the list as the user types
+        self.search_var = StringVar()
+        self.search_var.trace_add("write", self.schedule_filter)
+        ttk.Entry(self.left_frame.scrollable_frame,
+                  textvariable=self.search_var).pack(fill="x", pady=(5, 5))
+        self.filter_job = None
+
+        self.function_status = tk.Label(
+            self.left_frame.scrollable_frame, text="", font=("Arial", 9))
+        self.function_status.pack(anchor="w")
+
+        # A Listbox only draws the visible rows, so it stays responsive
+        # with thousands of functions; selected rows have an open tab.
         self.function_frame = tk.Frame(self.left_frame.scrollable_frame)
         self.function_frame.pack(fill="both", expand=True)
+        self.function_list = tk.Listbox(
+            self.function_frame, selectmode="multiple", exportselection=False,
+            height=25, width=40)
+        list_scrollbar = ttk.Scrollbar(
+            self.function_frame, orient="vertical", command=self.function_list.yview)
+        self.function_list.configure(yscrollcommand=list_scrollbar.set)
+        self.function_list.pack(side="left", fill="both", expand=True)
+        list_scrollbar.pack(side="right", fill="y")
+        self.function_list.bind("<<ListboxSelect>>", self.select_functions)
+        self.visible_functions = []
 
     def load_functions(self, event):
-        """Load functions of the selected module into checkboxes."""
-        for widget in self.function_frame.winfo_children():
-            widget.destroy()
-
+        """Load functions of the selected module into the function list."""
         module_name = self.module_var.get()
-        functions = self.functionExtractor(self.modules[module_name])
+        functions = self.functionExtractor(
+            module_name, self.modules.get(module_name),
+            lambda functions: self.root.after(0, self.show_functions, module_name, functions))
+        if functions is None:
+            self.clear_functions()
+            self.function_status.config(text=f"Indexing {module_name}...")
+        else:
+            self.show_functions(module_name, functions)
+
+    def clear_functions(self):
         self.function_args.clear()
-        self.function_checkboxes.clear()
-
-        for func_name in functions:
-            self.function_args[func_name] = functions[func_name]
-            var = BooleanVar()
-            chk = tk.Checkbutton(
-                self.function_frame, text=func_name, variable=var,
-                command=lambda f=func_name, v=var: self.toggle_function(f, v)
-            )
-            chk.pack(anchor="w")
-            self.function_checkboxes[func_name] = var
+        self.visible_functions = []
+        self.function_list.delete(0, tk.END)
 
-    def toggle_function(self, func_name, var):
-        """Toggle display of function arguments in tabs based on checkbox state."""
-        if var.get():
-            self.add_function_tab(func_name)
-        else:
-            self.remove_function_tab(func_name)
+    def show_functions(self, module_name, functions):
+        """Display the functions of module_name if it is still the selected module."""
+        if module_name != self.module_var.get():
+            return
+        self.function_args.clear()
+        self.function_args.update(functions)
+        self.coroutines = set()
+        if self.coroutineExtractor is not None:
+            self.coroutines = set(self.coroutineExtractor(
+                module_name, self.modules.get(module_name)))
+        self.filter_functions()
+
+    def schedule_filter(self, *args):
+        """Filter shortly after the last keystroke instead of on every one."""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(150, self.filter_functions)
+
+    def filter_functions(self):
+        """Show the functions whose name contains the search text."""
+        self.filter_job = None
+        text = self.search_var.get().strip().lower()
+        self.visible_functions = [name for name in self.function_args
+                                  if text in name.lower()]
+        self.function_list.delete(0, tk.END)
+        if self.visible_functions:
+            # async def functions are flagged; they run on an event loop
+            self.function_list.insert(tk.END, *[
+                f"{name}  (async)" if name in self.coroutines else name
+                for name in self.visible_functions])
+        for i, func_name in enumerate(self.visible_functions):
+            if func_name in self.function_tabs:
+                self.function_list.selection_set(i)
+        self.function_status.config(
+            text=f"{len(self.visible_functions)} of {len(self.function_args)} functions")
+
+    def select_functions(self, event):
+        """Open a tab for every selected function and close the deselected ones."""
+        selected = {self.visible_functions[i]
+                    for i in self.function_list.curselection()}
+        for func_name in self.visible_functions:
+            if func_name in selected:
+                self.add_function_tab(func_name)
+            else:
+                self.remove_function_tab(func_name)
 
     def add_function_tab(self, func_name):
         """Add selected function's arguments in a new tab with inputs and a Run button."""
@@ -408,17 +499,47 @@ class GUI:
             run_button = tk.Button(
                 func_frame.scrollable_frame, text="Run",
                 command=lambda: self.run_function(
-                    module_name, func_name, arg_entries, freq_entry, interval_entry)
+                    module_name, func_name, arg_entries, freq_entry, interval_entry,
+                    option_entries)
             )
             run_button.grid(row=row, column=4, padx=5, pady=5)
 
+            # Sweep button: "|" separates the alternatives of an argument
+            sweep_button = tk.Button(
+                func_frame.scrollable_frame, text="Sweep",
+                command=lambda: self.sweep_function(
+                    module_name, func_name, arg_entries, freq_entry, interval_entry,
+                    option_entries)
+            )
+            sweep_button.grid(row=row, column=5, padx=5, pady=5)
+            row += 1
+
+            # Optional measurement settings, two per row
+            option_entries = {}
+            for i, (key, label) in enumerate(self.OPTION_FIELDS):
+                column = 2 * (i % 2)
+                tk.Label(func_frame.scrollable_frame, text=label).grid(
+                    row=row, column=column, sticky="w", padx=5, pady=5)
+                entry = tk.Entry(func_frame.scrollable_frame, width=10)
+                entry.grid(row=row, column=column + 1, sticky="w", padx=5, pady=5)
+                option_entries[key] = entry
+                row += i % 2
+            row += len(self.OPTION_FIELDS) % 2
+            for key, label in self.OPTION_CHECKS:
+                var = BooleanVar()
+                tk.Checkbutton(func_frame.scrollable_frame, text=label, variable=var).grid(
+                    row=row, column=0, columnspan=4, sticky="w", padx=5, pady=5)
+                option_entries[key] = var
+                row += 1
+
     def remove_function_tab(self, func_name):
         """Remove function's tab from the notebook."""
         if func_name in self.function_tabs:
             func_frame = self.function_tabs.pop(func_name)
             self.notebook.forget(func_frame)
 
-    def run_function(self, module_name, func_name, arg_entries, freq_entry, interval_entry):
+    def run_function(self, module_name, func_name, arg_entries, freq_entry, interval_entry,
+                     option_entries):
         """Run the specified function with arguments, frequency, and interval."""
         # Show loading
         self.loading_label.config(text="Status: Running...", fg="blue")
@@ -432,21 +553,164 @@ class GUI:
                 args[arg] = value
 
         frequency = int(freq_entry.get() or 0)
-        interval = int(interval_entry.get() or 0)
+        interval = float(interval_entry.get() or 0)
+        options = self.read_options(option_entries)
+        fractions = options.pop("fractions", None)
+        if fractions:
+            # A single fraction applies to every dataset
+            options["fractions"] = {name: fractions[0] for name in self.dataset}
 
         # Run function in a new thread to avoid UI freeze
         threading.Thread(
             target=lambda: self.execute_function(
-                module_name, func_name, args, frequency, interval)
+                module_name, func_name, args, frequency, interval, **options)
         ).start()
 
-    def execute_function(self, module_name, func_name, args, frequency, interval, csv=""):
+    def read_options(self, option_entries):
+        """Convert the optional measurement settings into Runner.run keyword arguments."""
+        values = {key: entry.get() for key, entry in option_entries.items()}
+        values = {key: value.strip() if isinstance(value, str) else value
+                  for key, value in values.items()}
+        options = {}
+        if values.get("sample_rate"):
+            options["sample_rate"] = min(float(values["sample_rate"]), 1000)
+        if values.get("warmup"):
+            options["warmup"] = int(values["warmup"])
+        if values.get("target_ci"):
+            options["target_ci"] = float(values["target_ci"]) / 100
+        if values.get("budget"):
+            options["budget"] = float(values["budget"])
+        if values.get("min_window"):
+            options["min_window"] = float(values["min_window"]) / 1000
+        if values.get("calibrate"):
+            options["calibrate"] = True
+        if values.get("worker"):
+            options["worker"] = True
+        if values.get("socket"):
+            options["socket"] = int(values["socket"])
+        if values.get("spread"):
+            options["spread"] = int(values["spread"])
+        if values.get("bind_memory"):
+            options["bind_memory"] = True
+        if values.get("setup"):
+            options["setup"] = values["setup"]
+        if values.get("teardown"):
+            options["teardown"] = values["teardown"]
+        if values.get("fresh_args"):
+            options["fresh_args"] = True
+        if values.get("processes"):
+            options["processes"] = True
+        if values.get("memory"):
+            options["memory"] = True
+        if values.get("trace_frames"):
+            options["trace_frames"] = int(values["trace_frames"])
+        if values.get("cooldown"):
+            options["cooldown"] = True
+        if values.get("memo"):
+            options["memo"] = True
+        if values.get("refresh"):
+            options["refresh"] = True
+        if values.get("max_temperature"):
+            options["max_temperature"] = float(values["max_temperature"])
+        if values.get("max_power"):
+            options["max_power"] = float(values["max_power"])
+        if values.get("profile"):
+            options["profile"] = float(values["profile"])
+        if values.get("concurrency"):
+            options["concurrency"] = int(values["concurrency"])
+        if values.get("fractions"):
+            options["fractions"] = [float(value) for value in
+                                    values["fractions"].replace(",", " ").split()]
+        return options
+
+    def sweep_function(self, module_name, func_name, arg_entries, freq_entry, interval_entry,
+                       option_entries):
+        """Measure every combination of argument alternatives and row fractions."""
+        self.loading_label.config(text="Status: Sweeping...", fg="blue")
+        self.output_text.delete("1.0", tk.END)
+
+        grid = {}
+        for arg, entry in arg_entries.items():
+            alternatives = [value.strip() for value in entry.get().split("|")]
+            alternatives = [value for value in alternatives if value]
+            if alternatives:
+                grid[arg] = alternatives
+
+        frequency = int(freq_entry.get() or 0)
+        interval = float(interval_entry.get() or 0)
+        options = self.read_options(option_entries)
+        fractions = options.pop("fractions", None)
+        # The job queue lives in the runner's database, so sweeps run in-process
+        options.pop("worker", None)
+
+        def work():
+            sweep = None
+            runner = self.get_runner().job()
+            try:
+                from sweep import Sweep
+                sweep = Sweep(runner, module_name, func_name, grid, fractions, frequency,
+                              interval, dict(self.dataset), options=options)
+                lines = []
+                failures = sweep.run(progress=lines.append)
+                csv = f"{module_name.strip()}-{func_name.strip()}-sweep-{sweep.id}.csv"
+                sweep.save_csv(csv)
+                fitted = sweep.fit()
+                if fitted:
+                    lines.append(f"Energy per call ~ {fitted[0]:.4g} * size ^ {fitted[1]:.3f}")
+                lines.append(f"{failures} failed points. Wrote sweep results to {csv}")
+                self.output_text.insert("1.0", "Output:\n" + "\n".join(lines))
+            except Exception as e:
+                self.output_text.insert("1.0", f"Error: {e}")
+            finally:
+                if sweep is not None:
+                    sweep.close()
+                runner.close_loop()
+                self.loading_label.config(text="Status: Idle", fg="green")
+
+        threading.Thread(target=work).start()
+
+    def execute_function(self, module_name, func_name, args, frequency, interval, csv="",
+                         **options):
         """Execute the function and update output display."""
         try:
-            output = self.runner.run(
-                module_name, func_name, args, frequency, interval, csv, self.dataset)
+            if options.pop("worker", False):
+                output = self.get_workers().run(
+                    module_name, func_name, args, frequency, interval, csv, self.dataset,
+                    **options)
+            else:
+                runner = self.get_runner().job()
+                try:
+                    output = runner.run(
+                        module_name, func_name, args, frequency, interval, csv, self.dataset,
+                        **options)
+                finally:
+                    runner.close_loop()
             self.output_text.insert("1.0", f"Output:\n{output}")
         except Exception as e:
             self.output_text.insert("1.0", f"Error: {e}")
         finally:
             self.loading_label.config(text="Status: Idle", fg="green")
+
+    def get_runner(self):
+        """Create the in-process runner on first use; it imports numpy and pandas.
+
+        Every Run and Sweep uses its own runner from job(), so jobs started
+        from different tabs do not overwrite each other's status.
+        """
+        with self.lazy_lock:
+            if self.runner is None:
+                from runner import Runner
+                self.runner = Runner()
+        return self.runner
+
+    def get_workers(self):
+        """Start the worker pool on first use and keep the GUI off the workers' CPUs."""
+        with self.lazy_lock:
+            if self.workers is None:
+                self.workers = WorkerPool()
+                if hasattr(os, "sched_setaffinity"):
+                    # This runs in a background thread; pid 0 would only pin it,
+                    # the process id pins the main thread running the Tk loop
+                    # and the threads it starts from now on.
+                    os.sched_setaffinity(os.getpid(), self.workers.reserved_cpus())
+        return self.workers
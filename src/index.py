@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import inspect
+import pkgutil
+import threading
+import importlib
+import importlib.util
+from collections import deque
+from functools import lru_cache
+from importlib import metadata
+
+INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "slem", "index.json")
+# Bump when extract_functions changes so older entries are rebuilt
+INDEX_FORMAT = 3
+SKIPPED_SUBMODULES = {"tests", "testing", "conftest", "setup"}
+
+
+@lru_cache(maxsize=None)
+def _distributions():
+    try:
+        return metadata.packages_distributions()
+    except Exception:
+        return {}
+
+
+def installed_version(module_name):
+    """Return a string that changes whenever the installed module changes, without importing it."""
+    top = module_name.strip().split(".")[0]
+    for distribution in _distributions().get(top, [top]):
+        try:
+            return metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            pass
+    if top in sys.stdlib_module_names:
+        return "python-" + ".".join(map(str, sys.version_info[:3]))
+    try:
+        spec = importlib.util.find_spec(top)
+    except (ImportError, ValueError):
+        spec = None
+    if spec and spec.origin and os.path.exists(spec.origin):
+        return f"mtime-{os.path.getmtime(spec.origin)}"
+    return None
+
+
+def _parameters(obj):
+    try:
+        return [param.name for param in inspect.signature(obj).parameters.values()]
+    except (TypeError, ValueError):
+        # C callables without a text signature, e.g. NumPy ufuncs
+        nin = getattr(obj, "nin", None)
+        if isinstance(nin, int):
+            return [f"x{i + 1}" for i in range(nin)]
+        return []
+
+
+def _submodules(module):
+    """Import the public submodules of a package that are not loaded yet."""
+    for info in pkgutil.iter_modules(getattr(module, "__path__", [])):
+        if info.name.startswith("_") or info.name in SKIPPED_SUBMODULES:
+            continue
+        try:
+            importlib.import_module(f"{module.__name__}.{info.name}")
+        except (Exception, SystemExit):
+            # Some submodules are scripts that exit when imported
+            pass
+
+
+def _callables(module, depth=2, import_submodules=True, limit=20000):
+    """Yield (qualified name, callable) for the callables of a module.
+
+    Submodules of the same package and classes are walked up to depth
+    levels below the module, so entries look like "linalg.norm" or
+    "DataFrame.sort_values". Builtins, ufuncs and other C-implemented
+    callables are included as well as Python functions.
+    """
+    root = module.__name__.split(".")[0]
+    count = 0
+    seen = {id(module)}
+    # Breadth-first, so objects reachable from several places keep their shortest name
+    queue = deque([(module, "", 0)])
+    while queue and count < limit:
+        obj, prefix, level = queue.popleft()
+        if import_submodules and inspect.ismodule(obj) and level < depth:
+            _submodules(obj)
+        for name in dir(obj):
+            # Private helpers are only listed at the top level
+            if name.startswith("__") or (level and name.startswith("_")):
+                continue
+            try:
+                member = getattr(obj, name)
+            except Exception:
+                continue
+            qualified = prefix + name
+            if inspect.ismodule(member) or inspect.isclass(member):
+                owner = member.__name__ if inspect.ismodule(member) else \
+                    str(getattr(member, "__module__", ""))
+                if level < depth and owner.startswith(root) and id(member) not in seen:
+                    seen.add(id(member))
+                    queue.append((member, qualified + ".", level + 1))
+            elif callable(member):
+                count += 1
+                yield qualified, member
+
+
+def extract_functions(module, depth=2, import_submodules=True, limit=20000):
+    """Return {qualified name: parameter names} for the callables of a module."""
+    return {name: _parameters(member)
+            for name, member in _callables(module, depth, import_submodules, limit)}
+
+
+def extract_coroutines(module, depth=2, import_submodules=True, limit=20000):
+    """Return the qualified names of the async def functions of a module."""
+    return [name for name, member in _callables(module, depth, import_submodules, limit)
+            if inspect.iscoroutinefunction(member)]
+
+
+class FunctionIndex:
+    """On-disk index of function names and signatures keyed by module and version.
+
+    Lookups never import the module. When the installed version differs
+    from the indexed one, the module is imported and re-indexed in a
+    background thread.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.building = set()
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def lookup(self, module_name):
+        """Return the indexed functions and whether they match the installed version."""
+        entry = self.entries.get(module_name)
+        if entry is None:
+            return None, False
+        current = (entry.get("format") == INDEX_FORMAT
+                   and entry["version"] == installed_version(module_name))
+        return entry["functions"], current
+
+    def coroutines(self, module_name):
+        """Return the indexed names of the module's async def functions."""
+        return self.entries.get(module_name, {}).get("coroutines", [])
+
+    def build(self, module_name):
+        module = importlib.import_module(module_name)
+        members = dict(_callables(module))
+        functions = {name: _parameters(member) for name, member in members.items()}
+        with self.lock:
+            self.entries[module_name] = {
+                "format": INDEX_FORMAT,
+                "version": installed_version(module_name),
+                "functions": functions,
+                "coroutines": [name for name, member in members.items()
+                               if inspect.iscoroutinefunction(member)],
+            }
+            self.save()
+        return functions
+
+    def rebuild(self, module_name, callback=None):
+        """Re-index module_name in the background and pass the result to callback."""
+        with self.lock:
+            if module_name in self.building:
+                return
+            self.building.add(module_name)
+
+        def work():
+            try:
+                functions = self.build(module_name)
+            except Exception as e:
+                print(f"Unable to index {module_name}: {e}")
+                functions = None
+            finally:
+                with self.lock:
+                    self.building.discard(module_name)
+            if callback and functions is not None:
+                callback(functions)
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self.entries, f)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            print(f"Unable to save function index: {e}")
@@ -1,19 +1,38 @@
-import inspect
-import gui
-
-
-def get_functions(module):
-    functions = {}
-    for name, obj in inspect.getmembers(module):
-        print(name)
-        try:
-            if inspect.isfunction(obj):
-                functions[name] = [
-                    param.name for param in inspect.signature(obj).parameters.values()]
-        except:
-            pass
+import sys
+import multiprocessing
+from index import FunctionIndex, extract_functions, extract_coroutines
+
+function_index = FunctionIndex()
+
+
+def get_functions(module_name, module=None, on_update=None):
+    """Return {function name: parameter names} for a module, without importing it if possible.
+
+    Modules loaded from a file are inspected directly. For configured
+    modules the on-disk index is used; when it is missing or out of date
+    the module is re-indexed in the background and on_update receives the
+    new list.
+    """
+    if module is not None:
+        return extract_functions(module)
+    functions, current = function_index.lookup(module_name)
+    if not current:
+        function_index.rebuild(module_name, on_update)
     return functions
 
 
+def get_coroutines(module_name, module=None):
+    """Return the names of the async def functions of a module, as far as they are known."""
+    if module is not None:
+        return extract_coroutines(module)
+    return function_index.coroutines(module_name)
+
+
 if __name__ == "__main__":
-    gui.GUI(get_functions)
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        # Headless: python main.py spec.toml, without importing Tk
+        from cli import main
+        sys.exit(main())
+    import gui
+    gui.GUI(get_functions, get_coroutines)
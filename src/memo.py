@@ -0,0 +1,137 @@
+import json
+import time
+import hashlib
+import inspect
+import platform
+from index import installed_version
+from results import library_versions
+
+MAX_AGE = 30 * 86400
+MAX_ENTRIES = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memo (
+    key TEXT PRIMARY KEY,
+    run_id INTEGER,
+    samples INTEGER,
+    created REAL,
+    used REAL
+);
+"""
+
+# Options of Runner.run that change what is measured, including the
+# warm-up and thermal state the function runs in. Only frequency and
+# budget are left out: they change how many samples are taken, so a run
+# with enough samples can be reused.
+MEASURED_OPTIONS = ("sample_rate", "min_window", "calibrate", "socket", "spread",
+                    "bind_memory", "fractions", "setup", "teardown", "fresh_args", "profile",
+                    "concurrency", "processes", "memory", "trace_frames", "target_ci",
+                    "warmup", "interval", "cooldown", "max_temperature", "max_power")
+
+
+def cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.partition(":")[2].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def fingerprint(function):
+    """Hash the source of a function, or its bytecode and constants when there is no source."""
+    target = inspect.unwrap(function)
+    try:
+        text = inspect.getsource(target)
+    except (OSError, TypeError):
+        code = getattr(target, "__code__", None)
+        if code is not None:
+            text = repr((code.co_code, code.co_consts, code.co_names))
+        else:
+            # C functions change only with the installed version, hashed separately
+            text = f"{getattr(target, '__module__', '')}.{getattr(target, '__qualname__', '')}"
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class MemoCache:
+    """Maps the content of an experiment to a stored run that measured it.
+
+    The key hashes the function's source, the argument expressions, the
+    content of the datasets, the installed library versions, the CPU model
+    and the options that change what is measured. Entries live in the
+    memo table of the results database and are evicted by age and by
+    count, least recently used first.
+    """
+
+    def __init__(self, store, datasets, max_age=MAX_AGE, max_entries=MAX_ENTRIES):
+        self.store = store
+        self.datasets = datasets
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+    def connection(self):
+        connection = self.store.connect()
+        connection.executescript(SCHEMA)
+        return connection
+
+    def key(self, mname, function, args, dataset, options):
+        content = {
+            "module": mname.strip(),
+            "function": fingerprint(function),
+            "args": args,
+            "datasets": {name: self.datasets.content_hash(path)
+                         for name, path in (dataset or {}).items()},
+            "versions": {**library_versions(mname),
+                         mname.strip(): installed_version(mname.strip())},
+            "cpu": cpu_model(),
+            "options": {name: options.get(name) for name in MEASURED_OPTIONS},
+        }
+        text = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def lookup(self, key, samples):
+        """Return the run stored under key if it has at least samples iterations."""
+        with self.store.lock:
+            self.store.flush()
+            connection = self.connection()
+            row = connection.execute(
+                "SELECT run_id, samples FROM memo WHERE key = ? AND created >= ?",
+                (key, time.time() - self.max_age)).fetchone()
+            if row is None or row[1] < samples:
+                return None
+            connection.execute("UPDATE memo SET used = ? WHERE key = ?", (time.time(), key))
+            connection.commit()
+        return row[0]
+
+    def record(self, key, run_id):
+        with self.store.lock:
+            self.store.flush()
+            connection = self.connection()
+            samples = connection.execute(
+                "SELECT COUNT(DISTINCT iteration) FROM samples WHERE run_id = ?",
+                (run_id,)).fetchone()[0]
+            now = time.time()
+            connection.execute(
+                "INSERT OR REPLACE INTO memo (key, run_id, samples, created, used)"
+                " VALUES (?, ?, ?, ?, ?)", (key, run_id, samples, now, now))
+            connection.commit()
+        self.evict()
+
+    def evict(self):
+        """Drop entries older than max_age and all but the max_entries most recently used."""
+        with self.store.lock:
+            connection = self.connection()
+            connection.execute("DELETE FROM memo WHERE created < ?",
+                               (time.time() - self.max_age,))
+            connection.execute(
+                "DELETE FROM memo WHERE key NOT IN"
+                " (SELECT key FROM memo ORDER BY used DESC LIMIT ?)", (self.max_entries,))
+            connection.commit()
+
+    def clear(self):
+        with self.store.lock:
+            connection = self.connection()
+            connection.execute("DELETE FROM memo")
+            connection.commit()
@@ -0,0 +1,111 @@
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _status(*keys):
+    """Return the given /proc/self/status values (kB fields) in bytes."""
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in keys:
+                    values[key] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return values
+
+
+def reset_peak_rss():
+    """Reset VmHWM to the current RSS; returns False where the kernel does not allow it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _faults():
+    if resource is None:
+        return 0, 0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_minflt, usage.ru_majflt
+
+
+def _allocate(count=200000):
+    return [object() for _ in range(count)]
+
+
+def tracing_overhead(frames, repeat=5):
+    """Return how much slower allocation-heavy code runs with tracemalloc at frames depth."""
+    def best():
+        times = []
+        for _ in range(repeat):
+            began = time.perf_counter()
+            _allocate()
+            times.append(time.perf_counter() - began)
+        return min(times)
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.stop()
+    plain = best()
+    tracemalloc.start(frames)
+    traced = best()
+    tracemalloc.stop()
+    if tracing:
+        tracemalloc.start(frames)
+    return traced / plain - 1
+
+
+class MemoryTracker:
+    """Records peak RSS, page faults and optionally tracemalloc allocations per measurement.
+
+    frames is the tracemalloc level: 0 leaves allocation tracing off, so
+    only the nearly free RSS and page-fault counters are read; n traces
+    allocations with n frames per traceback, which slows every allocation.
+    Readings are taken just outside the tracker's window.
+    """
+
+    def __init__(self, frames=0):
+        self.frames = frames
+        self.values = {}
+        self.started = None
+        self.resets_peak = True
+        self.overhead = None
+        if frames:
+            self.overhead = tracing_overhead(frames)
+            tracemalloc.start(frames)
+
+    def begin(self):
+        self.resets_peak = reset_peak_rss()
+        rss = _status("VmRSS").get("VmRSS", 0)
+        traced = tracemalloc.get_traced_memory()[0] if self.frames else 0
+        if self.frames:
+            tracemalloc.reset_peak()
+        self.started = (rss, traced) + _faults()
+
+    def end(self):
+        minor, major = _faults()
+        status = _status("VmHWM", "VmRSS")
+        rss, traced, start_minor, start_major = self.started
+        self.values = {
+            "Peak RSS (bytes)": status.get("VmHWM", ""),
+            "RSS growth (bytes)": status.get("VmRSS", rss) - rss,
+            "Minor page faults": minor - start_minor,
+            "Major page faults": major - start_major,
+        }
+        if self.frames:
+            current, peak = tracemalloc.get_traced_memory()
+            self.values["Allocated peak (bytes)"] = peak - traced
+            self.values["Allocated net (bytes)"] = current - traced
+
+    def close(self):
+        if self.frames and tracemalloc.is_tracing():
+            tracemalloc.stop()
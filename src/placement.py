@@ -0,0 +1,135 @@
+import os
+import glob
+import ctypes
+import platform
+
+# set_mempolicy(2) is not exposed by the os module
+SYS_SET_MEMPOLICY = {"x86_64": 238, "aarch64": 237}
+MPOL_DEFAULT = 0
+MPOL_BIND = 2
+
+
+def _read_list(path):
+    """Parse a sysfs CPU/node list such as "0-3,8-11"."""
+    with open(path) as f:
+        text = f.read().strip()
+    items = []
+    for part in text.split(","):
+        if "-" in part:
+            low, high = part.split("-")
+            items.extend(range(int(low), int(high) + 1))
+        elif part:
+            items.append(int(part))
+    return items
+
+
+def socket_cpus():
+    """Return the usable CPUs of every socket (physical package)."""
+    usable = os.sched_getaffinity(0)
+    sockets = {}
+    for path in glob.glob("/sys/devices/system/cpu/cpu[0-9]*/topology/physical_package_id"):
+        cpu = int(path.split("/")[5][3:])
+        if cpu not in usable:
+            continue
+        with open(path) as f:
+            sockets.setdefault(int(f.read().strip()), []).append(cpu)
+    return {socket: sorted(cpus) for socket, cpus in sorted(sockets.items())}
+
+
+def socket_nodes(socket):
+    """Return the NUMA nodes whose CPUs belong to the given socket."""
+    cpus = set(socket_cpus().get(socket, []))
+    nodes = []
+    for path in glob.glob("/sys/devices/system/node/node[0-9]*/cpulist"):
+        if cpus & set(_read_list(path)):
+            nodes.append(int(path.split("/")[5][4:]))
+    return sorted(nodes)
+
+
+def spread_cpus(count):
+    """Pick count CPUs alternating between sockets."""
+    sockets = list(socket_cpus().values())
+    cpus = []
+    for i in range(max(len(cpus) for cpus in sockets) if sockets else 0):
+        for socket in sockets:
+            if i < len(socket):
+                cpus.append(socket[i])
+    return cpus[:count] if count else cpus
+
+
+def set_mempolicy(mode, nodes=()):
+    number = SYS_SET_MEMPOLICY.get(platform.machine())
+    if number is None:
+        raise OSError(f"set_mempolicy is not supported on {platform.machine()}")
+    libc = ctypes.CDLL(None, use_errno=True)
+    mask = 0
+    for node in nodes:
+        mask |= 1 << node
+    nodemask = ctypes.c_ulong(mask)
+    maxnode = ctypes.sizeof(nodemask) * 8 + 1
+    pointer = ctypes.byref(nodemask) if nodes else None
+    if libc.syscall(number, mode, pointer, ctypes.c_ulong(maxnode)) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+
+class Placement:
+    """Pins the calling thread to one socket or spreads it over sockets.
+
+    Linux applies affinity and memory policy per thread, so only the
+    measuring thread and the threads it starts are affected. The previous
+    affinity and memory policy are restored on exit.
+    """
+
+    def __init__(self, socket=None, spread=0, bind_memory=False):
+        self.socket = socket
+        self.spread = spread
+        self.bind_memory = bind_memory
+        self.previous = None
+
+    def cpus(self):
+        if self.socket is not None:
+            cpus = socket_cpus().get(self.socket)
+            if not cpus:
+                raise ValueError(f"No usable CPUs on socket {self.socket}")
+            return cpus
+        return spread_cpus(self.spread)
+
+    def __enter__(self):
+        self.previous = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, self.cpus())
+        if self.bind_memory and self.socket is not None:
+            try:
+                set_mempolicy(MPOL_BIND, socket_nodes(self.socket))
+            except Exception:
+                # __exit__ does not run when __enter__ fails
+                os.sched_setaffinity(0, self.previous)
+                raise
+        return self
+
+    def __exit__(self, *exc):
+        os.sched_setaffinity(0, self.previous)
+        if self.bind_memory and self.socket is not None:
+            set_mempolicy(MPOL_DEFAULT)
+        return False
+
+
+def attribute(energy, socket):
+    """Subtract the idle sockets' readings from the active socket's, domain by domain.
+
+    The idle sockets run at the same time as the active one, so they act
+    as a control for the static power of a socket.
+    """
+    by_kind = {}
+    for domain, value in energy.items():
+        kind, _, index = domain.rpartition("-")
+        if kind and index.isdigit():
+            by_kind.setdefault(kind, {})[int(index)] = value
+    attributed = {}
+    for kind, readings in by_kind.items():
+        if socket not in readings:
+            continue
+        idle = [value for index, value in readings.items() if index != socket]
+        control = sum(idle) / len(idle) if idle else 0
+        attributed[f"{kind}-{socket}"] = readings[socket] - control
+    return attributed
@@ -0,0 +1,225 @@
+import os
+import csv
+import time
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+# Domains split between the workload and the rest of the host
+ATTRIBUTED_PREFIXES = ("package",)
+# Windows shorter than this many clock ticks cannot be split with tick counters
+MIN_TICKS = 5
+
+
+def _read_stat(path):
+    """Return (comm, ppid, utime + stime, cutime + cstime) in clock ticks from a stat file."""
+    with open(path) as f:
+        text = f.read()
+    # comm may contain spaces and parentheses, so split after the last ")"
+    comm = text[text.index("(") + 1:text.rindex(")")]
+    fields = text[text.rindex(")") + 2:].split()
+    return comm, int(fields[1]), int(fields[11]) + int(fields[12]), \
+        int(fields[13]) + int(fields[14])
+
+
+def _read_schedstat(path):
+    """Return the time on CPU in seconds from a schedstat file (nanoseconds), or None."""
+    try:
+        with open(path) as f:
+            return int(f.read().split()[0]) / 1e9
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def host_busy():
+    """Return the busy CPU time of the whole host in seconds and whether it is in nanoseconds.
+
+    /proc/schedstat has the time every CPU spent running tasks in
+    nanoseconds; without it the clock ticks of /proc/stat are used.
+    """
+    try:
+        with open("/proc/schedstat") as f:
+            return sum(int(line.split()[7]) for line in f
+                       if line.startswith("cpu")) / 1e9, True
+    except (OSError, ValueError, IndexError):
+        pass
+    with open("/proc/stat") as f:
+        values = [int(value) for value in f.readline().split()[1:]]
+    # user nice system idle iowait irq softirq steal (guest time is part of user)
+    return (sum(values[:8]) - values[3] - values[4]) / CLOCK_TICKS, False
+
+
+def process_tree(root):
+    """Return the pids of root and all of its descendants."""
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            _, ppid, _, _ = _read_stat(f"/proc/{name}/stat")
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    tree = []
+    stack = [root]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def snapshot(root, harness=()):
+    """Return the CPU seconds of every thread of root's process tree and of the host.
+
+    Keys are (kind, pid, tid, name): kind is "workload" or "harness" for a
+    thread and "reaped" for the time of exited children collected by a
+    process, which keeps the total steady when pool workers exit. Threads
+    are read from schedstat in nanoseconds where the kernel provides it.
+    Returns (times, host busy seconds, whether every counter is in
+    nanoseconds, perf_counter time).
+    """
+    times = {}
+    precise = True
+    for pid in process_tree(root):
+        try:
+            comm, _, _, reaped = _read_stat(f"/proc/{pid}/stat")
+            tids = os.listdir(f"/proc/{pid}/task")
+        except (OSError, ValueError, IndexError):
+            continue
+        # Only available in clock ticks; it only changes when children exit
+        times[("reaped", pid, 0, comm)] = reaped / CLOCK_TICKS
+        for tid in tids:
+            task = f"/proc/{pid}/task/{tid}"
+            try:
+                name, _, busy, _ = _read_stat(task + "/stat")
+            except (OSError, ValueError, IndexError):
+                continue
+            seconds = _read_schedstat(task + "/schedstat")
+            if seconds is None:
+                seconds = busy / CLOCK_TICKS
+                precise = False
+            kind = "harness" if int(tid) in harness else "workload"
+            times[(kind, pid, int(tid), name)] = seconds
+    host, host_precise = host_busy()
+    return times, host, precise and host_precise, time.perf_counter()
+
+
+def _used(start, stop):
+    """Return {key: CPU seconds} between two snapshots and the host's busy CPU seconds."""
+    used = {}
+    for key, seconds in stop[0].items():
+        delta = seconds - start[0].get(key, 0)
+        if delta > 0:
+            used[key] = delta
+    # The host and the per-thread counters are read separately; the
+    # threads never use more than the host's busy time
+    return used, max(stop[1] - start[1], sum(used.values()), 0)
+
+
+class ProcessTracker:
+    """Splits package energy between the workload's threads and the rest of the host.
+
+    The CPU time of every thread in the process tree of root is read from
+    /proc/<pid>/task right before the tracker's start snapshot and right
+    after its stop snapshot, and by the tracker's sampler with every RAPL
+    reading in between. The package energy of every interval between two
+    readings is attributed in proportion to each thread's share of the
+    host's busy CPU time over that interval; what is left is the share of
+    other work on the host.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.getpid()
+        self.harness = set()
+        self.start = None
+        self.stop = None
+        self.last = None
+        # Package energy attributed to every key over the sampled intervals
+        self.charged = {}
+        self.charged_energy = 0.0
+        self.warned = False
+
+    def snapshot(self):
+        return snapshot(self.root, self.harness)
+
+    def begin(self):
+        self.start = self.last = self.snapshot()
+        self.stop = None
+        self.charged = {}
+        self.charged_energy = 0.0
+
+    def end(self):
+        self.stop = self.snapshot()
+
+    def _charge(self, charged, start, stop, energy):
+        used, host = _used(start, stop)
+        if not host:
+            return
+        for key, seconds in used.items():
+            charged[key] = charged.get(key, 0.0) + energy * seconds / host
+        charged["other"] = charged.get("other", 0.0) + \
+            energy * (1 - sum(used.values()) / host)
+
+    def sample(self, current, energy):
+        """Attribute the package energy since the previous reading; called by the sampler."""
+        self._charge(self.charged, self.last, current, energy)
+        self.charged_energy += energy
+        self.last = current
+
+    def reliable(self):
+        """Whether the counters resolve the window; tick counters need several ticks."""
+        return self.stop[2] or self.stop[3] - self.start[3] >= MIN_TICKS / CLOCK_TICKS
+
+    def shares(self):
+        """Return {key: CPU seconds} over the window and the host's busy CPU seconds."""
+        return _used(self.start, self.stop)
+
+    def attribute(self, package=0):
+        """Return per-thread (key, CPU seconds, share) rows and the workload, harness and other shares.
+
+        Shares are of the package energy when it is known and of the busy
+        CPU time otherwise; None when the window is too short to split.
+        """
+        if not self.reliable():
+            return None
+        charged = dict(self.charged)
+        if package > 0:
+            # The energy after the sampler's last reading, up to the stop snapshot
+            self._charge(charged, self.last, self.stop, max(package - self.charged_energy, 0))
+            total = sum(charged.values()) or 1.0
+        else:
+            charged = {}
+            self._charge(charged, self.start, self.stop, 1.0)
+            total = 1.0
+        used, _ = self.shares()
+        rows = []
+        split = {"workload": 0.0, "harness": 0.0, "reaped": 0.0}
+        for key, seconds in sorted(used.items(), key=lambda item: -item[1]):
+            share = charged.get(key, 0.0) / total
+            split[key[0]] += share
+            rows.append((key, seconds, share))
+        return rows, {"workload": split["workload"] + split["reaped"],
+                      "harness": split["harness"],
+                      "other": charged.get("other", 0.0) / total}
+
+    def save_csv(self, filename, energy, start_time):
+        """Append one row per thread with its CPU time, share and attributed package energy."""
+        package = sum(value for domain, value in energy.items()
+                      if domain.startswith(ATTRIBUTED_PREFIXES))
+        attributed = self.attribute(package)
+        if attributed is None:
+            if not self.warned:
+                self.warned = True
+                print(f"The window is shorter than {MIN_TICKS} clock ticks and the kernel "
+                      "has no nanosecond CPU counters; package energy is not split")
+            return
+        rows, shares = attributed
+        with open(filename, "a") as f:
+            writer = csv.writer(f)
+            if f.tell() == 0:
+                writer.writerow(["Start", "Kind", "PID", "TID", "Name", "CPU time (s)",
+                                 "Share", "Attributed (micro joules)"])
+            for (kind, pid, tid, name), seconds, share in rows:
+                writer.writerow([start_time, kind, pid, tid, name, seconds, share,
+                                 package * share])
+            writer.writerow([start_time, "other", "", "", "other work on the host", "",
+                             shares["other"], package * shares["other"]])
@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import time
+import threading
+import numpy
+
+# Domains whose power is spread over the stack samples; core/uncore are part of package
+PROFILED_PREFIXES = ("package", "dram")
+
+
+class StackProfiler:
+    """Samples the Python stack of the measuring thread and attributes energy to it.
+
+    A daemon thread reads the thread's current frame at a fixed rate. Each
+    stack sample is charged the energy of the tracker's power trace between
+    the previous sample and this one, so the energy of a stack is the energy
+    spent while it was running. Frames above root_code (the harness) are
+    dropped.
+    """
+
+    def __init__(self, rate=1000, root_code=None):
+        self.rate = rate
+        self.root_code = root_code
+        self.names = {}
+        self.energy = {}
+        self.time = {}
+        self.counts = {}
+        self.samples = []
+        self.cost = 0.0
+        self.window = 0.0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def _frame(self, code):
+        name = self.names.get(code)
+        if name is None:
+            name = (code.co_qualname if hasattr(code, "co_qualname") else code.co_name,
+                    code.co_filename, code.co_firstlineno)
+            self.names[code] = name
+        return name
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None:
+            if frame.f_code is self.root_code:
+                break
+            stack.append(self._frame(frame.f_code))
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    def _loop(self, thread_id):
+        period = 1.0 / self.rate
+        deadline = time.perf_counter() + period
+        while not self.stop_event.wait(max(0.0, deadline - time.perf_counter())):
+            began = time.perf_counter()
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self.samples.append((began, self._stack(frame)))
+            frame = None
+            self.cost += time.perf_counter() - began
+            deadline += period
+
+    def start(self, thread_id=None):
+        self.samples = []
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self._loop, args=(thread_id or threading.get_ident(),), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def collect(self, tracker):
+        """Charge the samples taken inside the tracker's last window with its power trace."""
+        sampler = tracker.sampler
+        if sampler is None or sampler.origin is None:
+            return
+        start, end = sampler.origin, sampler.last_time
+        samples = [(moment, stack) for moment, stack in self.samples if start <= moment <= end]
+        self.samples = []
+        self.window += end - start
+        if not samples:
+            return
+        trace = sampler.trace()
+        columns = [i + 1 for i, name in enumerate(sampler.names)
+                   if name.startswith(PROFILED_PREFIXES)]
+        # Cumulative energy at the end of every trace row, each row holding
+        # the average power since the previous one
+        times = numpy.concatenate(([start], trace[:, 0] + start))
+        power = trace[:, columns].sum(axis=1) if columns else numpy.zeros(len(trace))
+        cumulative = numpy.concatenate(([0.0], numpy.cumsum(power * numpy.diff(times) * 1e6)))
+        moments = numpy.array([moment for moment, _ in samples])
+        bounds = numpy.concatenate(([start], moments))
+        energy = numpy.diff(numpy.interp(bounds, times, cumulative))
+        elapsed = numpy.diff(bounds)
+        for (_, stack), micro_joules, seconds in zip(samples, energy.tolist(), elapsed.tolist()):
+            self.energy[stack] = self.energy.get(stack, 0.0) + micro_joules
+            self.time[stack] = self.time.get(stack, 0.0) + seconds
+            self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    def overhead(self):
+        """Fraction of the measured time the sampling thread held the interpreter."""
+        return self.cost / self.window if self.window else 0.0
+
+    def _label(self, frame):
+        name, filename, line = frame
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def save_collapsed(self, filename):
+        """Write "frame;frame;frame energy" lines, in integer micro joules, for flame graph tools."""
+        with open(filename, "w") as f:
+            for stack, energy in sorted(self.energy.items(), key=lambda item: -item[1]):
+                if stack:
+                    f.write(";".join(self._label(frame) for frame in stack)
+                            + f" {int(round(energy))}\n")
+
+    def save_speedscope(self, filename, name="SLEM profile"):
+        """Write an energy and a time profile in the speedscope file format."""
+        frames = {}
+        samples = []
+        for stack in self.energy:
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+        stacks = list(self.energy)
+
+        def profile(title, unit, weights):
+            return {"type": "sampled", "name": title, "unit": unit, "startValue": 0,
+                    "endValue": sum(weights), "samples": samples, "weights": weights}
+
+        document = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "SLEM",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": frame[0], "file": frame[1], "line": frame[2]}
+                                  for frame in frames]},
+            "profiles": [
+                profile("Energy (micro joules)", "none",
+                        [self.energy[stack] for stack in stacks]),
+                profile("Time", "seconds", [self.time[stack] for stack in stacks]),
+            ],
+        }
+        with open(filename, "w") as f:
+            json.dump(document, f)
@@ -0,0 +1,257 @@
+import csv
+import json
+import time
+import socket
+import sqlite3
+import platform
+import datetime
+import threading
+from importlib import metadata
+
+DEFAULT_PATH = "slem_results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    module TEXT,
+    function TEXT,
+    arguments TEXT,
+    dataset TEXT,
+    host TEXT,
+    python TEXT,
+    versions TEXT,
+    options TEXT,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER REFERENCES runs(id),
+    iteration INTEGER,
+    time REAL,
+    domain TEXT,
+    energy NUMERIC,
+    duration REAL,
+    batch INTEGER,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_run ON samples(run_id);
+CREATE INDEX IF NOT EXISTS runs_target ON runs(module, function);
+"""
+
+# Columns of EnergyTracker.table() that get their own column in samples
+CORE_COLUMNS = {
+    "Domain": "domain",
+    "Energy (micro joules)": "energy",
+    "Duration (s)": "duration",
+    "Batch": "batch",
+}
+
+
+def library_versions(mname):
+    """Return the installed versions of the target's distribution and the usual data libraries."""
+    versions = {}
+    for name in (mname.strip().split(".")[0], "numpy", "pandas"):
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            pass
+    return versions
+
+
+def _timestamp(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime.combine(value, datetime.time())
+        return value.timestamp()
+    return value
+
+
+class ResultStore:
+    """Buffers measurement rows in memory and writes them to SQLite in batches.
+
+    Each run gets a row in the runs table with its arguments, dataset,
+    host and library versions; every domain of every iteration becomes a
+    row of the samples table. Rows are written when the run finishes or
+    when flush_interval seconds have passed since the last write, always
+    between iterations.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, flush_interval=30.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.iterations = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    def start_run(self, module, function, arguments, dataset, options) -> int:
+        with self.lock:
+            connection = self.connect()
+            cursor = connection.execute(
+                "INSERT INTO runs (module, function, arguments, dataset, host, python,"
+                " versions, options, started) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (module.strip(), function.strip(), json.dumps(arguments),
+                 json.dumps(dataset), socket.gethostname(), platform.python_version(),
+                 json.dumps(library_versions(module)), json.dumps(options, default=str),
+                 time.time()))
+            connection.commit()
+            self.iterations[cursor.lastrowid] = 0
+            return cursor.lastrowid
+
+    def add(self, run_id, tracker):
+        """Buffer the last measurement of tracker as the run's next iteration."""
+        header, rows = tracker.table()
+        with self.lock:
+            iteration = self.iterations[run_id]
+            self.iterations[run_id] += 1
+            for row in rows:
+                extra = dict(zip(header, row))
+                core = [extra.pop(column) for column in CORE_COLUMNS]
+                self.pending.append((run_id, iteration, tracker.start_time, *core,
+                                     json.dumps(extra)))
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                connection = self.connect()
+                connection.executemany(
+                    "INSERT INTO samples (run_id, iteration, time, domain, energy, duration,"
+                    " batch, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.pending)
+                connection.commit()
+                self.pending = []
+            self.last_flush = time.monotonic()
+
+    def finish_run(self, run_id):
+        with self.lock:
+            self.flush()
+            self.connection.execute(
+                "UPDATE runs SET finished = ? WHERE id = ?", (time.time(), run_id))
+            self.connection.commit()
+            self.iterations.pop(run_id, None)
+
+    def update_options(self, run_id, values):
+        """Merge values, e.g. timings known only after the run, into a run's options."""
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute(
+                "SELECT options FROM runs WHERE id = ?", (run_id,)).fetchone()
+            options = json.loads(row[0] or "{}") if row else {}
+            options.update(values)
+            connection.execute("UPDATE runs SET options = ? WHERE id = ?",
+                               (json.dumps(options, default=str), run_id))
+            connection.commit()
+
+    def runs(self, module=None, function=None, dataset=None, since=None, until=None):
+        """Return the runs matching every given filter, newest first.
+
+        dataset matches any part of a dataset path, since and until accept
+        timestamps, dates or datetimes.
+        """
+        clauses, values = [], []
+        if module:
+            clauses.append("module = ?")
+            values.append(module)
+        if function:
+            clauses.append("function = ?")
+            values.append(function)
+        if dataset:
+            clauses.append("dataset LIKE ?")
+            values.append(f"%{dataset}%")
+        if since is not None:
+            clauses.append("started >= ?")
+            values.append(_timestamp(since))
+        if until is not None:
+            clauses.append("started < ?")
+            values.append(_timestamp(until))
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with self.lock:
+            self.flush()
+            rows = self.connect().execute(
+                f"SELECT * FROM runs{where} ORDER BY started DESC", values).fetchall()
+        return [self._decode(dict(row)) for row in rows]
+
+    def get_run(self, run_id):
+        with self.lock:
+            self.flush()
+            row = self.connect().execute(
+                "SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return self._decode(dict(row)) if row else None
+
+    def samples(self, run_id):
+        with self.lock:
+            self.flush()
+            rows = self.connect().execute(
+                "SELECT * FROM samples WHERE run_id = ? ORDER BY iteration, rowid",
+                (run_id,)).fetchall()
+        samples = []
+        for row in rows:
+            sample = dict(row)
+            sample.update(json.loads(sample.pop("extra") or "{}"))
+            samples.append(sample)
+        return samples
+
+    def query(self, module=None, function=None, dataset=None, since=None, until=None):
+        """Return the samples of every matching run, each with its run's metadata."""
+        results = []
+        for run in self.runs(module, function, dataset, since, until):
+            for sample in self.samples(run["id"]):
+                results.append({**run, **sample})
+        return results
+
+    def _decode(self, run):
+        for key in ("arguments", "dataset", "versions", "options"):
+            run[key] = json.loads(run[key] or "null")
+        return run
+
+    def export_csv(self, run_id, filename):
+        """Write a run's samples in the long format, one row per domain and iteration."""
+        samples = self.samples(run_id)
+        extra = []
+        for sample in samples:
+            for key in sample:
+                if key not in extra:
+                    extra.append(key)
+        columns = ["iteration", "time", "domain", "energy", "duration", "batch"]
+        names = ["Iteration", "Time", "Domain", "Energy (micro joules)", "Duration (s)",
+                 "Batch"]
+        extra = [key for key in extra if key not in columns and key != "run_id"]
+        with open(filename, "a") as f:
+            writer = csv.writer(f)
+            if f.tell() == 0:
+                writer.writerow(names + extra)
+            for sample in samples:
+                writer.writerow([sample.get(key, "") for key in columns + extra])
+
+    def export_wide(self, run_id, filename):
+        """Write a run in the evaluation_results format: Time followed by one column per domain."""
+        iterations = {}
+        for sample in self.samples(run_id):
+            row = iterations.setdefault(sample["iteration"], {"Time": sample["duration"]})
+            row[sample["domain"]] = sample["energy"]
+        domains = []
+        for row in iterations.values():
+            for key in row:
+                if key not in domains:
+                    domains.append(key)
+        with open(filename, "w") as f:
+            writer = csv.DictWriter(f, fieldnames=domains)
+            writer.writeheader()
+            writer.writerows(iterations.values())
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -2,8 +2,29 @@ import os
 import sys
 import time
 import io
+import asyncio
 import contextlib
 import datetime
+import inspect
+import importlib
+import functools
+from itertools import repeat
+from energy_measure import EnergyTracker, autorange
+from dataset import DatasetManager
+from results import ResultStore, DEFAULT_PATH
+from calibration import get_calibration
+from placement import Placement
+from profiler import StackProfiler
+from processes import ProcessTracker
+from memory import MemoryTracker
+from thermal import Cooldown, temperature
+from memo import MemoCache
+from stats import mad_filter, relative_width, summarize, save_summary
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Determine the base path
 if getattr(sys, 'frozen', False):  # Running as a PyInstaller executable
@@ -13,53 +34,474 @@ else:  # Running as a script
 
 # Read files using the base path
 init_config_path = os.path.join(base_path, "init.config")
-energy_measure_path = os.path.join(base_path, "energy_measure.py")
 
 INIT_DATA = open(init_config_path).read()
-MEASURE_ENERGY = open(energy_measure_path).read()
+
+# With fresh arguments every call of a batch holds its own copy of the
+# inputs until the window closes, so batches stay small
+FRESH_BATCH_LIMIT = 100
 
 
 class Runner:
 
-    def run(self, mname: str, fname: str, args, frquency: int, interval: int, csv: str, dataset: dict) -> str:
+    def __init__(self, memory_limit: int = 2 * 1024 ** 3, store_path: str = DEFAULT_PATH,
+                 datasets: DatasetManager = None, store: ResultStore = None):
+        self.datasets = datasets if datasets is not None else DatasetManager(memory_limit)
+        self.store = store if store is not None else ResultStore(store_path)
+        self.memo = MemoCache(self.store, self.datasets)
+        self.last_run_id = None
+        # Exceptions caught during the last run, for callers that need an exit status
+        self.errors = 0
+        # Stack profiler of the current run, if profiling was requested
+        self.profiler = None
+        # Event loop shared by every async run, created on first use
+        self.loop = None
+        # Waits for the CPU to cool down between iterations, if requested
+        self.cooldown = None
+
+    def job(self):
+        """Return a runner for one of several concurrent jobs, e.g. in the GUI.
+
+        It shares the dataset cache and the results database but keeps its
+        own errors, last run, profiler, cooldown and event loop.
+        """
+        return Runner(datasets=self.datasets, store=self.store)
+
+    def prepare(self, dataset: dict, fractions: dict = None) -> dict:
+        """Build the namespace the arguments are evaluated in, once per run.
+
+        fractions optionally maps a df_N handle to the fraction of its rows
+        to keep, sampled with a fixed seed so every run sees the same rows.
+        """
+        namespace = {}
+        exec(compile(INIT_DATA, init_config_path, "exec"), namespace)
+        if dataset:
+            import pandas
+            namespace["pandas"] = pandas
+            for data in dataset:
+                frame, elapsed, source = self.datasets.load(dataset[data])
+                print(f"Loaded {data} from {source} in {elapsed:.3f} s")
+                fraction = (fractions or {}).get(data, 1)
+                if fraction < 1:
+                    frame = frame.sample(frac=fraction, random_state=0).sort_index()
+                    print(f"Using {len(frame)} rows of {data}")
+                # Hand out a copy so a function that mutates its input
+                # cannot change the cached frame seen by later runs.
+                namespace[data] = frame.copy()
+        return namespace
+
+    def sizes(self, evaluated_args: dict) -> dict:
+        """Return the length (or value, for numbers) of every non-string argument that has one."""
+        sizes = {}
+        for key, value in evaluated_args.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                sizes[key] = value
+            elif not isinstance(value, (str, bytes)):
+                try:
+                    sizes[key] = len(value)
+                except TypeError:
+                    pass
+        return sizes
+
+    def resolve(self, mname: str, fname: str):
+        """Import the target module and return the function to measure.
+
+        fname may be a qualified name such as "linalg.norm" or
+        "DataFrame.sort_values"; submodules are imported as needed.
+        """
+        target = importlib.import_module(mname.strip())
+        for part in fname.strip().split("."):
+            try:
+                target = getattr(target, part)
+            except AttributeError:
+                if not inspect.ismodule(target):
+                    raise
+                target = importlib.import_module(f"{target.__name__}.{part}")
+        return target
+
+    def bind(self, function, evaluated_args: dict):
+        """Return a zero-argument callable that calls function with the arguments.
+
+        Positional-only parameters (common in builtins) are passed by
+        position, as are all arguments of callables without a signature
+        such as ufuncs.
+        """
+        try:
+            parameters = inspect.signature(function).parameters
+        except (TypeError, ValueError):
+            return functools.partial(function, *evaluated_args.values())
+        positional = []
+        keywords = dict(evaluated_args)
+        for name, parameter in parameters.items():
+            if parameter.kind is not inspect.Parameter.POSITIONAL_ONLY:
+                break
+            if name not in keywords:
+                break
+            positional.append(keywords.pop(name))
+        return functools.partial(function, *positional, **keywords)
+
+    def evaluate(self, args: dict, namespace: dict) -> dict:
+        evaluated_args = {}
+        for key, value in args.items():
+            try:
+                evaluated_args[key] = eval(value, namespace)
+            except Exception:
+                evaluated_args[key] = value
+        return evaluated_args
+
+    def hook(self, code: str, namespace: dict, name: str) -> float:
+        """Execute setup or teardown code in the argument namespace and return its duration."""
+        began = time.perf_counter()
+        exec(compile(code, f"<{name}>", "exec"), namespace)
+        elapsed = time.perf_counter() - began
+        print(f"{name.capitalize()} took {elapsed:.3f} s")
+        return elapsed
+
+    def factory(self, function, args: dict, evaluated_args: dict, fresh, namespace: dict):
+        """Return a function that builds a call with the fresh arguments re-evaluated.
+
+        fresh is True for every argument or a list of argument names; the
+        other arguments keep the values evaluated once in run().
+        """
+        names = list(args) if fresh is True else [name for name in fresh if name in args]
+
+        def make_call():
+            values = dict(evaluated_args)
+            values.update(self.evaluate({name: args[name] for name in names}, namespace))
+            return self.bind(function, values)
+        return make_call
+
+    def event_loop(self):
+        """Return the runner's event loop (uvloop when installed), created once and reused."""
+        if self.loop is None or self.loop.is_closed():
+            self.loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+        return self.loop
+
+    def close_loop(self):
+        """Close the event loop of a runner from job() once its job is done."""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.close()
+
+    def asynchronous(self, call, concurrency: int = 1):
+        """Turn a call of an async def function into a blocking one on the shared loop.
+
+        Each blocking call runs concurrency tasks of call() at once.
+        """
+        loop = self.event_loop()
+        if concurrency > 1:
+            async def gather():
+                return await asyncio.gather(*[call() for _ in repeat(None, concurrency)])
+            return lambda: loop.run_until_complete(gather())
+        return lambda: loop.run_until_complete(call())
+
+    def measure(self, et, call, interval, csv, run_id, make_call=None):
+        """Measure one batch of calls and return the energy and duration per call.
+
+        With make_call, every call of the batch gets its own arguments,
+        built before the window opens.
+        """
+        calls = None
+        try:
+            if self.cooldown is not None:
+                # Start from the same thermal state instead of after a fixed delay
+                et.annotations["Cooldown (s)"] = self.cooldown.wait()
+                et.annotations.update(self.cooldown.readings())
+            if make_call is not None:
+                began = time.perf_counter()
+                calls = [make_call() for _ in repeat(None, et.batch)]
+                et.annotations["Arguments (s)"] = time.perf_counter() - began
+            if self.profiler is not None:
+                self.profiler.start()
+            if calls is not None:
+                et.start()
+                for prepared in calls:
+                    result = prepared()
+                et.stop()
+            elif et.batch == 1:
+                et.start()
+                result = call()
+                et.stop()
+            else:
+                et.start()
+                for _ in repeat(None, et.batch):
+                    result = call()
+                et.stop()
+            if self.profiler is not None:
+                self.profiler.stop()
+                self.profiler.collect(et)
+            if self.cooldown is not None:
+                et.annotations["End temperature (C)"] = temperature()
+            # Release the result and the inputs outside the measured window.
+            result = calls = None
+            self.store.add(run_id, et)
+            trace = et.compute_trace()
+            if trace:
+                et.save_trace(os.path.splitext(csv)[0] + "-trace.csv", trace)
+            if et.processes:
+                et.processes.save_csv(os.path.splitext(csv)[0] + "-processes.csv",
+                                      et.compute(), et.start_time)
+            if self.cooldown is None:
+                time.sleep(interval)
+            calls = et.batch * et.concurrency
+            energy = {domain: value / calls
+                      for domain, value in et.compute().items()}
+            return energy, (et.stop_time - et.start_time) / calls
+        except Exception as e:
+            if et.state == "running":
+                et.stop()
+            if self.profiler is not None:
+                self.profiler.stop()
+            self.errors += 1
+            print(f"Exception occurred:{e}")
+            return None, None
+
+    def save_profile(self, csv, run_id):
+        stem = os.path.splitext(csv)[0]
+        self.profiler.save_collapsed(stem + "-profile.collapsed")
+        self.profiler.save_speedscope(stem + "-profile.speedscope.json",
+                                      os.path.basename(stem))
+        overhead = self.profiler.overhead()
+        self.store.update_options(run_id, {"profile_overhead": overhead})
+        print(f"Profiler overhead: {overhead:.2%} of the measured time; "
+              f"wrote {stem}-profile.collapsed and {stem}-profile.speedscope.json")
+
+    def adaptive(self, et, call, limit, interval, csv, run_id, target_ci, budget,
+                 min_samples=5, make_call=None):
+        """Measure until the CI of every domain is narrower than target_ci or the budget runs out."""
+        samples = {"Duration (s)": []}
+        deadline = time.perf_counter() + budget
+        iterations = 0
+        converged = False
+        while not limit or iterations < limit:
+            energy, duration = self.measure(et, call, interval, csv, run_id, make_call)
+            iterations += 1
+            if energy is not None:
+                samples["Duration (s)"].append(duration)
+                for domain in energy:
+                    samples.setdefault(domain, []).append(energy[domain])
+            # Domains that never register any energy cannot have a relative
+            # width, so they do not hold back the stopping rule.
+            tracked = [values for name, values in samples.items()
+                       if name != "Duration (s)" and any(values)]
+            if not tracked:
+                tracked = [samples["Duration (s)"]]
+            if len(tracked[0]) >= min_samples:
+                width = max(relative_width(mad_filter(values)) for values in tracked)
+                if width <= target_ci:
+                    converged = True
+                    break
+            if time.perf_counter() >= deadline:
+                break
+        if converged:
+            print(f"Converged after {iterations} iterations "
+                  f"(relative CI width {width:.2%})")
+        else:
+            print(f"Stopped after {iterations} iterations without reaching "
+                  f"a relative CI width of {target_ci:.2%}")
+        summary = {name: summarize(values) for name, values in samples.items()}
+        save_summary(os.path.splitext(csv)[0] + "-summary.csv", summary, converged)
+
+    def batch_size(self, call, min_window, make_call=None):
+        """Return how many calls fill min_window; with make_call, sized with fresh arguments and capped."""
+        if make_call is None:
+            return autorange(call, min_window)
+        batch = autorange(lambda: make_call()(), min_window, FRESH_BATCH_LIMIT)
+        if batch >= FRESH_BATCH_LIMIT:
+            print(f"Fresh arguments limit batches to {FRESH_BATCH_LIMIT} calls")
+        return batch
+
+    def execute(self, et, call, frquency, interval, csv, run_id, warmup, target_ci, budget,
+                min_window, make_call=None):
+        """Warm up, size the batches and run the measurement loop."""
+        for _ in range(warmup):
+            try:
+                (make_call() if make_call else call)()
+            except Exception as e:
+                self.errors += 1
+                print(f"Exception occurred during warmup:{e}")
+
+        if min_window:
+            try:
+                et.batch = self.batch_size(call, min_window, make_call)
+                print(f"Measuring batches of {et.batch} calls")
+            except Exception as e:
+                self.errors += 1
+                print(f"Exception occurred during autorange:{e}")
+
+        # The target, tracker and arguments were resolved once in run();
+        # each iteration only pays for the snapshots around the calls.
+        if target_ci:
+            self.adaptive(et, call, frquency, interval, csv, run_id, target_ci, budget,
+                          make_call=make_call)
+        else:
+            for _ in range(frquency):
+                self.measure(et, call, interval, csv, run_id, make_call)
+
+    def run(self, mname: str, fname: str, args, frquency: int, interval: float, csv: str, dataset: dict,
+            sample_rate: float = 0, warmup: int = 0, target_ci: float = 0, budget: float = 60,
+            min_window: float = 0, calibrate: bool = False, socket: int = None,
+            spread: int = 0, bind_memory: bool = False, fractions: dict = None,
+            setup: str = "", teardown: str = "", fresh_args=False, profile: float = 0,
+            concurrency: int = 1, processes: bool = False, memory: bool = False,
+            trace_frames: int = 0, cooldown: bool = False, max_temperature: float = 0,
+            max_power: float = 0, memo: bool = False, refresh: bool = False) -> str:
+        """Measure fname with the given arguments frquency times.
+
+        setup runs once before the arguments are evaluated and teardown
+        once after the last measurement, both in the argument namespace and
+        outside the measured window. fresh_args (True or a list of argument
+        names) re-evaluates arguments before every measurement, for functions
+        that mutate their input; by default one input is shared. profile
+        samples the stack at that rate (Hz) and writes energy flame graphs.
+        async def functions run on a reused event loop, concurrency tasks at
+        a time, and their energy is reported per task. processes splits
+        package energy between the process tree, the harness and other work
+        on the host by CPU time share. memory records peak RSS and page
+        faults with every iteration, and allocations through tracemalloc
+        when trace_frames is set. With cooldown, each iteration starts once
+        the CPU is back below max_temperature (default: its temperature
+        before the run plus 2 degrees) and max_power, waiting at most
+        interval seconds, instead of after a fixed sleep of interval. With
+        memo, a stored run of the same code, arguments, datasets, libraries
+        and CPU with at least frquency iterations is returned instead of
+        measuring again, unless refresh is set.
+        """
         output = io.StringIO()
-        dataframes = """import pandas\n"""
-        for data in dataset:
-            dataframes += f"""{data} = pandas.read_csv("{dataset[data]}")\n"""
+        self.last_run_id = None
+        self.errors = 0
+        self.profiler = None
+        self.cooldown = None
+        if not csv:
+            csv = f"""{mname.strip()}-{fname.strip()
+                                       }-{datetime.datetime.now()}.csv"""
+        options = {"frequency": frquency, "interval": interval, "sample_rate": sample_rate,
+                   "warmup": warmup, "target_ci": target_ci, "budget": budget,
+                   "min_window": min_window, "calibrate": calibrate, "socket": socket,
+                   "spread": spread, "bind_memory": bind_memory, "fractions": fractions,
+                   "setup": setup, "teardown": teardown, "fresh_args": fresh_args,
+                   "profile": profile, "concurrency": concurrency, "processes": processes,
+                   "memory": memory, "trace_frames": trace_frames, "cooldown": cooldown,
+                   "max_temperature": max_temperature, "max_power": max_power}
+        # Temperature before the run heats up the CPU, the default cooldown target
+        baseline = temperature() if cooldown else None
         with contextlib.redirect_stdout(output):
-            for _ in range(frquency):
-                if not csv:
-                    csv = f"""{mname.strip()}-{fname.strip()
-                                               }-{datetime.datetime.now()}.csv"""
+            memo_key = None
+            if memo:
+                try:
+                    memo_key = self.memo.key(mname, self.resolve(mname, fname), args, dataset,
+                                             options)
+                    cached = None if refresh else self.memo.lookup(memo_key, frquency)
+                except Exception as e:
+                    print(f"Unable to check the memo cache, measuring again:{e}")
+                    memo_key = cached = None
+                if cached is not None:
+                    self.last_run_id = cached
+                    self.store.export_csv(cached, csv)
+                    return output.getvalue() + (
+                        f"Reused run {cached}: code, arguments, datasets and libraries are "
+                        f"unchanged. Wrote measurement to {csv} (run {cached} in "
+                        f"{self.store.path})")
+            try:
+                namespace = self.prepare(dataset, fractions)
+                timings = {}
+                if setup:
+                    timings["setup_time"] = self.hook(setup, namespace, "setup")
+                function = self.resolve(mname, fname)
+                namespace[fname.strip()] = function
+                evaluated_args = self.evaluate(args, namespace)
+                call = self.bind(function, evaluated_args)
+                make_call = None
+                if fresh_args:
+                    make_call = self.factory(function, args, evaluated_args, fresh_args,
+                                             namespace)
+                if inspect.iscoroutinefunction(function):
+                    call = self.asynchronous(call, concurrency)
+                    if make_call is not None:
+                        factory = make_call
+
+                        def make_call():
+                            return self.asynchronous(factory(), concurrency)
+                elif concurrency > 1:
+                    print("Concurrent tasks only apply to async def functions, running one")
+                    concurrency = 1
+                if profile:
+                    # Stack samples are charged with the power trace
+                    sample_rate = sample_rate or min(profile, 1000)
+                    self.profiler = StackProfiler(profile, Runner.measure.__code__)
+                et = EnergyTracker(sample_rate=sample_rate)
+                et.concurrency = concurrency
+                if processes:
+                    et.processes = ProcessTracker()
+                if memory or trace_frames:
+                    et.memory = MemoryTracker(trace_frames)
+                    if et.memory.overhead is not None:
+                        timings["tracemalloc_overhead"] = et.memory.overhead
+                        print(f"tracemalloc with {trace_frames} frames slows allocations "
+                              f"by {et.memory.overhead:.0%}")
+            except SyntaxError as e:
+                self.errors += 1
+                print("Syntax Error:")
+                print(f"Message: {e.msg}")
+                print(f"Line: {e.lineno}, Offset: {e.offset}")
+                print(f"Text: {e.text.strip() if e.text else None}")
+                return output.getvalue()
+            except Exception as e:
+                self.errors += 1
+                print(f"Exception occurred:{e}")
+                return output.getvalue()
+
+            if cooldown:
+                self.cooldown = Cooldown(et, max_temperature, max_power=max_power,
+                                         max_wait=interval or 30, baseline=baseline)
+
+            if calibrate:
+                try:
+                    et.calibration = get_calibration()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Exception occurred during calibration:{e}")
+
+            # Profiling may raise the sample rate and sync functions run one task
+            options.update({"sample_rate": sample_rate, "concurrency": concurrency,
+                            "event_loop": type(self.loop).__module__ if self.loop else None,
+                            "sizes": self.sizes(evaluated_args), **timings})
+            run_id = self.store.start_run(mname, fname, args, dataset, options)
+            self.last_run_id = run_id
+
+            placement = contextlib.nullcontext()
+            if socket is not None or spread:
+                placement = Placement(socket, spread, bind_memory)
+                et.active_socket = socket
+            try:
+                with placement:
+                    self.execute(et, call, frquency, interval, csv, run_id, warmup,
+                                 target_ci, budget, min_window, make_call)
+            except Exception as e:
+                self.errors += 1
+                print(f"Exception occurred during placement:{e}")
+            et.close()
+            # The cooldown holds the closed tracker; later runs build their own
+            self.cooldown = None
+            if et.memory is not None:
+                et.memory.close()
+                if not et.memory.resets_peak:
+                    print("Peak RSS could not be reset and covers the whole process")
+            if self.profiler is not None:
+                self.save_profile(csv, run_id)
+            if et.phases.children:
+                # The phase tree is only written once, after the last iteration
+                et.save_phases(os.path.splitext(csv)[0] + "-phases.csv")
+                self.store.update_options(run_id, {"phases": et.phases.to_dict()})
+            if teardown:
                 try:
-                    exec(
-                        f"""
-{INIT_DATA}
-{dataframes}
-from {mname.strip()} import {fname}
-{MEASURE_ENERGY}
-
-evaluated_args = {{}}
-raw_args = {args}
-for key, value in raw_args.items():
-    try:
-        evaluated_args[key] = eval(value, globals(), locals())
-    except Exception as e:
-        evaluated_args[key] = value
-et = EnergyTracker()
-et.start()
-result = {fname}(**evaluated_args)
-et.stop()
-et.save_csv(f"{csv}")
-# measure_energy({fname},'{csv}')(**evaluated_args)
-
-""", globals())
-                    time.sleep(interval)
-                except SyntaxError as e:
-                    print("Syntax Error:")
-                    print(f"Message: {e.msg}")
-                    print(f"Line: {e.lineno}, Offset: {e.offset}")
-                    print(f"Text: {e.text.strip() if e.text else None}")
+                    self.store.update_options(
+                        run_id, {"teardown_time": self.hook(teardown, namespace, "teardown")})
                 except Exception as e:
-                    print(f"Exception occurred:{e}")
-        return output.getvalue() + f"Wrote measurement to {csv}"
+                    self.errors += 1
+                    print(f"Exception occurred during teardown:{e}")
+            # Rows were buffered during the run and are written in one go.
+            self.store.finish_run(run_id)
+            if memo_key is not None and not self.errors:
+                self.memo.record(memo_key, run_id)
+            self.store.export_csv(run_id, csv)
+        return output.getvalue() + f"Wrote measurement to {csv} (run {run_id} in {self.store.path})"
@@ -0,0 +1,99 @@
+import csv
+import math
+from statistics import NormalDist
+import numpy
+
+# Domains summed into the total; core/uncore are already part of package
+TOTAL_PREFIXES = ("package", "dram", "nvidia-gpu")
+
+
+def t_quantile(probability, dof):
+    """Approximate Student's t quantile (Cornish-Fisher expansion around the normal)."""
+    z = NormalDist().inv_cdf(probability)
+    if dof <= 0:
+        return math.inf
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    return z + g1 / dof + g2 / dof ** 2 + g3 / dof ** 3
+
+
+def mad_filter(values, threshold=3.5):
+    """Drop outliers whose robust z-score (based on the MAD) exceeds threshold."""
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if len(values) < 3:
+        return values
+    median = numpy.median(values)
+    mad = numpy.median(numpy.abs(values - median))
+    if mad == 0:
+        return values
+    robust_z = numpy.abs(values - median) / (1.4826 * mad)
+    return values[robust_z <= threshold]
+
+
+def confidence_interval(values, confidence=0.95):
+    """Return the mean and the (low, high) bounds of its confidence interval."""
+    values = numpy.asarray(values, dtype=numpy.float64)
+    n = len(values)
+    mean = float(values.mean()) if n else math.nan
+    if n < 2:
+        return mean, math.nan, math.nan
+    half = t_quantile(0.5 + confidence / 2, n - 1) * float(values.std(ddof=1)) / math.sqrt(n)
+    return mean, mean - half, mean + half
+
+
+def relative_width(values, confidence=0.95):
+    """Width of the confidence interval relative to the mean."""
+    mean, low, high = confidence_interval(values, confidence)
+    if math.isfinite(low) and math.isfinite(high) and mean != 0:
+        return abs((high - low) / mean)
+    return math.inf
+
+
+def summarize(values, confidence=0.95, threshold=3.5):
+    """Summarize raw samples after outlier rejection."""
+    raw = numpy.asarray(values, dtype=numpy.float64)
+    kept = mad_filter(raw, threshold)
+    mean, low, high = confidence_interval(kept, confidence)
+    return {
+        "mean": mean,
+        "median": float(numpy.median(kept)) if len(kept) else math.nan,
+        "ci_low": low,
+        "ci_high": high,
+        "samples": len(kept),
+        "dropped": len(raw) - len(kept),
+    }
+
+
+def save_summary(filename, summary, converged):
+    with open(filename, "a") as f:
+        writer = csv.writer(f)
+        if f.tell() == 0:
+            writer.writerow(["Metric", "Mean", "Median", "CI Low", "CI High",
+                             "Samples", "Dropped", "Converged"])
+        for name, row in summary.items():
+            writer.writerow([name, row["mean"], row["median"], row["ci_low"],
+                             row["ci_high"], row["samples"], row["dropped"], converged])
+
+
+def sign_flip_test(differences, permutations=10000, seed=0):
+    """Two-sided p-value of a paired sign-flip permutation test of a zero mean difference.
+
+    Every sign pattern is used for up to 16 pairs, otherwise a fixed-seed
+    random sample of permutations.
+    """
+    differences = numpy.asarray(differences, dtype=numpy.float64)
+    n = len(differences)
+    if n == 0:
+        return math.nan
+    observed = abs(differences.mean())
+    if n <= 16:
+        signs = ((numpy.arange(2 ** n)[:, None] >> numpy.arange(n)) & 1) * 2 - 1
+    else:
+        signs = numpy.random.default_rng(seed).choice((-1, 1), size=(permutations, n))
+    means = numpy.abs((signs * differences).mean(axis=1))
+    extreme = int(numpy.sum(means >= observed * (1 - 1e-9)))
+    if n <= 16:
+        return extreme / len(means)
+    # The observed signs count as one of the permutations
+    return (extreme + 1) / (len(means) + 1)
@@ -0,0 +1,178 @@
+import csv
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import itertools
+import numpy
+from stats import TOTAL_PREFIXES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweep_jobs (
+    sweep TEXT,
+    point TEXT,
+    status TEXT,
+    run_id INTEGER,
+    size REAL,
+    energy REAL,
+    duration REAL,
+    updated REAL,
+    PRIMARY KEY (sweep, point)
+);
+"""
+
+
+def grid_points(grid, fractions=None, datasets=()):
+    """Yield the cartesian product of argument alternatives and dataset fractions.
+
+    fractions maps a df_N handle to its fractions, or is a plain list
+    applied to every dataset in datasets at once.
+    """
+    fractions = fractions or {}
+    if not isinstance(fractions, dict):
+        fractions = {"*": list(fractions)}
+    names = list(grid)
+    for values in itertools.product(*grid.values(), *fractions.values()):
+        chosen = dict(zip(fractions, values[len(names):]))
+        if "*" in chosen:
+            chosen = {name: chosen["*"] for name in datasets}
+        yield {"args": dict(zip(names, values[:len(names)])), "fractions": chosen}
+
+
+def fit_power_law(sizes, energies):
+    """Fit energy = coefficient * size ** exponent in log-log space."""
+    sizes = numpy.asarray(sizes, dtype=numpy.float64)
+    energies = numpy.asarray(energies, dtype=numpy.float64)
+    valid = (sizes > 0) & (energies > 0)
+    if len(numpy.unique(sizes[valid])) < 2:
+        return None
+    exponent, intercept = numpy.polyfit(numpy.log(sizes[valid]), numpy.log(energies[valid]), 1)
+    return math.exp(intercept), float(exponent)
+
+
+class Sweep:
+    """Measures a function over a grid of arguments and dataset fractions.
+
+    Every point of the grid is a job in the sweep_jobs table of the
+    results database. The sweep id is derived from its definition, so
+    running the same sweep again skips the points that already finished.
+    """
+
+    def __init__(self, runner, mname, fname, grid, fractions=None, frequency=5, interval=0,
+                 dataset=None, size_arg=None, options=None):
+        self.runner = runner
+        self.mname = mname
+        self.fname = fname
+        self.grid = grid
+        self.fractions = fractions or {}
+        self.frequency = frequency
+        self.interval = interval
+        self.dataset = dataset or {}
+        self.size_arg = size_arg
+        self.options = options or {}
+        definition = json.dumps([mname.strip(), fname.strip(), grid, self.fractions, frequency,
+                                 self.dataset, size_arg, self.options], sort_keys=True,
+                                default=str)
+        self.id = hashlib.sha1(definition.encode()).hexdigest()[:16]
+        self.connection = sqlite3.connect(runner.store.path, timeout=30)
+        self.connection.executescript(SCHEMA)
+
+    def enqueue(self):
+        points = [json.dumps(point, sort_keys=True)
+                  for point in grid_points(self.grid, self.fractions, self.dataset)]
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO sweep_jobs (sweep, point, status, updated)"
+            " VALUES (?, ?, 'pending', ?)",
+            [(self.id, point, time.time()) for point in points])
+        self.connection.commit()
+        return len(points)
+
+    def pending(self):
+        rows = self.connection.execute(
+            "SELECT point FROM sweep_jobs WHERE sweep = ? AND status != 'done' ORDER BY rowid",
+            (self.id,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def measure(self, run_id):
+        """Return the mean package+DRAM energy and duration per call, and the size of a run."""
+        per_iteration = {}
+        for sample in self.runner.store.samples(run_id):
+            if str(sample["domain"]).startswith(TOTAL_PREFIXES):
+                energy, duration = per_iteration.get(sample["iteration"], (0.0, 0.0))
+                per_iteration[sample["iteration"]] = (
+                    energy + sample["energy"] / sample["batch"],
+                    sample["duration"] / sample["batch"])
+        options = self.runner.store.get_run(run_id)["options"]
+        sizes = options.get("sizes", {})
+        if self.size_arg:
+            size = sizes.get(self.size_arg)
+        else:
+            size = sum(sizes.values()) if sizes else None
+        if not per_iteration:
+            return size, None, None
+        values = numpy.array(list(per_iteration.values()))
+        return size, float(values[:, 0].mean()), float(values[:, 1].mean())
+
+    def run(self, progress=print):
+        """Run every unfinished point and return the number of failures."""
+        total = self.enqueue()
+        jobs = self.pending()
+        progress(f"Sweep {self.id}: {total - len(jobs)} of {total} points already done")
+        failures = 0
+        for i, point in enumerate(jobs, 1):
+            output = self.runner.run(
+                self.mname, self.fname, point["args"], self.frequency, self.interval, "",
+                self.dataset, fractions=point["fractions"], **self.options)
+            run_id = self.runner.last_run_id
+            key = json.dumps(point, sort_keys=True)
+            if run_id is None or self.runner.errors:
+                failures += 1
+                self.connection.execute(
+                    "UPDATE sweep_jobs SET status = 'failed', run_id = ?, updated = ?"
+                    " WHERE sweep = ? AND point = ?", (run_id, time.time(), self.id, key))
+                progress(f"[{i}/{len(jobs)}] {point} failed:\n{output}")
+            else:
+                size, energy, duration = self.measure(run_id)
+                self.connection.execute(
+                    "UPDATE sweep_jobs SET status = 'done', run_id = ?, size = ?, energy = ?,"
+                    " duration = ?, updated = ? WHERE sweep = ? AND point = ?",
+                    (run_id, size, energy, duration, time.time(), self.id, key))
+                progress(f"[{i}/{len(jobs)}] {point}: size {size}, {energy} micro joules per call")
+            self.connection.commit()
+        return failures
+
+    def results(self):
+        rows = self.connection.execute(
+            "SELECT point, run_id, size, energy, duration FROM sweep_jobs"
+            " WHERE sweep = ? AND status = 'done' ORDER BY size", (self.id,)).fetchall()
+        return [{"point": json.loads(point), "run_id": run_id, "size": size,
+                 "energy": energy, "duration": duration}
+                for point, run_id, size, energy, duration in rows]
+
+    def fit(self):
+        """Return (coefficient, exponent) of energy per call against size, if it can be fitted."""
+        results = [row for row in self.results()
+                   if row["size"] is not None and row["energy"] is not None]
+        return fit_power_law([row["size"] for row in results],
+                             [row["energy"] for row in results])
+
+    def predict(self, size):
+        fitted = self.fit()
+        if fitted is None:
+            return None
+        coefficient, exponent = fitted
+        return coefficient * size ** exponent
+
+    def save_csv(self, filename):
+        with open(filename, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Arguments", "Fractions", "Size", "Energy per call (micro joules)",
+                             "Duration per call (s)", "Run"])
+            for row in self.results():
+                writer.writerow([json.dumps(row["point"]["args"]),
+                                 json.dumps(row["point"]["fractions"]), row["size"],
+                                 row["energy"], row["duration"], row["run_id"]])
+
+    def close(self):
+        self.connection.close()
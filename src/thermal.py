@@ -0,0 +1,109 @@
+import glob
+import time
+from functools import lru_cache
+
+# hwmon drivers and thermal zone types that report the CPU package/cores
+CPU_SENSORS = ("coretemp", "k10temp", "zenpower", "x86_pkg_temp", "cpu")
+
+
+def _read_number(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _read_name(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+@lru_cache(maxsize=None)
+def temperature_inputs():
+    """Return the temperature files of the CPU sensors, or of every sensor if none is known."""
+    cpu, other = [], []
+    for hwmon in sorted(glob.glob("/sys/class/hwmon/hwmon*")):
+        name = _read_name(hwmon + "/name")
+        inputs = sorted(glob.glob(hwmon + "/temp*_input"))
+        (cpu if name.startswith(CPU_SENSORS) else other).extend(inputs)
+    for zone in sorted(glob.glob("/sys/class/thermal/thermal_zone*")):
+        kind = _read_name(zone + "/type")
+        (cpu if kind.startswith(CPU_SENSORS) else other).append(zone + "/temp")
+    return tuple(cpu or other)
+
+
+@lru_cache(maxsize=None)
+def frequency_inputs():
+    return tuple(sorted(glob.glob("/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq")))
+
+
+def temperature():
+    """Return the hottest CPU temperature in degrees Celsius, or None without sensors."""
+    values = [_read_number(path) for path in temperature_inputs()]
+    values = [value for value in values if value is not None]
+    return max(values) / 1000 if values else None
+
+
+def frequency():
+    """Return the mean current frequency of the CPUs in MHz, or None without cpufreq."""
+    values = [_read_number(path) for path in frequency_inputs()]
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) / 1000 if values else None
+
+
+class Cooldown:
+    """Waits between iterations until the CPU is back to its starting state.
+
+    The next iteration starts as soon as the hottest CPU sensor is below
+    max_temperature (by default the temperature before the first
+    iteration plus margin) and, if max_power is set, the package power is
+    below it, or after max_wait seconds at the latest.
+    """
+
+    def __init__(self, tracker, max_temperature=0, margin=2.0, max_power=0, max_wait=30,
+                 poll=0.1, baseline=None):
+        self.tracker = tracker
+        self.margin = margin
+        self.max_power = max_power
+        self.max_wait = max_wait
+        self.poll = poll
+        self.baseline = baseline if baseline is not None else temperature()
+        self.max_temperature = max_temperature or (
+            self.baseline + margin if self.baseline is not None else None)
+
+    def readings(self):
+        return {"Temperature (C)": temperature(), "Frequency (MHz)": frequency()}
+
+    def package_power(self):
+        """Package power in W over one poll interval, which is also the wait between polls."""
+        reader = self.tracker.reader
+        before = reader.read()
+        began = time.perf_counter()
+        time.sleep(self.poll)
+        after = reader.read()
+        elapsed = time.perf_counter() - began
+        energy = sum(self.tracker._delta(name, start, stop)
+                     for name, start, stop in zip(reader.names, before, after)
+                     if name.startswith("package"))
+        return energy / 1e6 / elapsed
+
+    def ready(self):
+        if self.max_temperature is not None:
+            current = temperature()
+            if current is not None and current > self.max_temperature:
+                return False
+        if self.max_power and self.tracker.reader.names:
+            return self.package_power() <= self.max_power
+        return True
+
+    def wait(self):
+        """Block until the machine has cooled down and return how long that took."""
+        began = time.perf_counter()
+        deadline = began + self.max_wait
+        while not self.ready() and time.perf_counter() < deadline:
+            time.sleep(self.poll)
+        return time.perf_counter() - began
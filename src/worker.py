@@ -0,0 +1,112 @@
+import os
+import sys
+import atexit
+import threading
+import importlib
+import multiprocessing
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _add_paths(paths):
+    for path in paths:
+        if path not in sys.path:
+            sys.path.append(path)
+
+
+def _serve(connection, mname, cpus, paths):
+    """Worker main loop: import the target once, then run jobs until told to stop."""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    _add_paths(paths)
+    from runner import Runner
+    runner = Runner()
+    try:
+        importlib.import_module(mname.strip())
+    except Exception as e:
+        print(f"Unable to import {mname}: {e}")
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        paths, args, kwargs = job
+        _add_paths(paths)
+        try:
+            output = runner.run(*args, **kwargs)
+        except Exception as e:
+            output = f"Error: {e}"
+        connection.send(output)
+    connection.close()
+
+
+class WorkerPool:
+    """Keeps one warm, CPU-pinned worker process per target module.
+
+    Workers are spawned on first use and stay alive between iterations
+    and runs, so the target module is imported and the datasets are
+    parsed once per worker. By default they are pinned to every CPU but
+    the first, which is left to the GUI.
+    """
+
+    def __init__(self, cpus=None):
+        if cpus is None:
+            cpus = available_cpus()
+            if len(cpus) > 1:
+                cpus = cpus[1:]
+        self.cpus = list(cpus)
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = {}
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def reserved_cpus(self):
+        """CPUs left to the calling process, i.e. the ones workers do not use."""
+        reserved = [cpu for cpu in available_cpus() if cpu not in self.cpus]
+        return reserved or available_cpus()
+
+    def _worker(self, mname):
+        with self.lock:
+            worker = self.workers.get(mname)
+            if worker and worker[0].is_alive():
+                return worker
+            parent, child = self.context.Pipe()
+            process = self.context.Process(
+                target=_serve, args=(child, mname, self.cpus, list(sys.path)),
+                name=f"slem-worker-{mname.strip()}")
+            process.start()
+            child.close()
+            worker = (process, parent, threading.Lock())
+            self.workers[mname] = worker
+            return worker
+
+    def run(self, mname, *args, **kwargs) -> str:
+        """Run Runner.run(mname, *args, **kwargs) in the module's worker."""
+        process, connection, lock = self._worker(mname)
+        with lock:
+            try:
+                connection.send((list(sys.path), (mname,) + args, kwargs))
+                return connection.recv()
+            except (EOFError, OSError) as e:
+                with self.lock:
+                    self.workers.pop(mname, None)
+                return f"Worker for {mname.strip()} exited unexpectedly: {e}"
+
+    def close(self):
+        with self.lock:
+            workers = list(self.workers.values())
+            self.workers.clear()
+        for process, connection, lock in workers:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()